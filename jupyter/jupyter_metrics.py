@@ -6,7 +6,10 @@
 import datetime
 import logging
 import os
+import socketserver
+import typing as t
 from wsgiref import simple_server
+from wsgiref import types as wsgi_types
 
 import prometheus_client
 import requests
@@ -51,14 +54,44 @@ def get_idletime() -> float:
 IDLETIME.set_function(get_idletime)
 
 
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, simple_server.WSGIServer):
+    """WSGI server which handles each request in a separate thread."""
+
+    daemon_threads = True
+
+
+def make_app(
+    registry: prometheus_client.registry.CollectorRegistry,
+) -> wsgi_types.WSGIApplication:
+    """Create a WSGI app for the metrics and a liveness endpoint.
+
+    `/healthz` responds without running any collector, so that probes
+    don't time out if a collector is slow. All other paths return the
+    metrics, gzip-compressed if the client accepts it.
+    """
+    metrics_app = prometheus_client.make_wsgi_app(registry)
+
+    def app(
+        environ: wsgi_types.WSGIEnvironment,
+        start_response: wsgi_types.StartResponse,
+    ) -> t.Iterable[bytes]:
+        if environ.get("PATH_INFO") == "/healthz":
+            start_response("200 OK", [("Content-Type", "text/plain")])
+            return [b"OK"]
+        return metrics_app(environ, start_response)
+
+    return app
+
+
 def start_server(
     addr: str,
     port: int,
     registry: prometheus_client.registry.CollectorRegistry,
 ) -> None:
-    """Start a WSGI server for Prometheus metrics."""
-    app = prometheus_client.make_wsgi_app(registry)
-    httpd = simple_server.make_server(addr, port, app)
+    """Start a threaded WSGI server for Prometheus metrics."""
+    httpd = simple_server.make_server(
+        addr, port, make_app(registry), server_class=ThreadingWSGIServer
+    )
     httpd.serve_forever()
 
 
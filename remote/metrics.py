@@ -4,68 +4,491 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import contextlib
+import ctypes
+import ctypes.util
+import dataclasses
 import datetime
+import fnmatch
 import logging
 import os
+import socketserver
 import subprocess
+import threading
+import time
 import typing as t
 from wsgiref import simple_server
+from wsgiref import types as wsgi_types
 
 import prometheus_client
 import psutil
 
 METRICS_PORT = int(os.getenv("METRICS_PORT", "9118"))
+# Interval in seconds in which the process metrics are sampled
+PROCESS_METRICS_INTERVAL = float(os.getenv("PROCESS_METRICS_INTERVAL", "15"))
+# Interval in seconds in which the output of `xpra info` is refreshed
+XPRA_METRICS_INTERVAL = float(os.getenv("XPRA_METRICS_INTERVAL", "15"))
+# Groups of processes, which are reported as one, in the format
+# `group=pattern,pattern;group=pattern`. The patterns match the process names.
+PROCESS_METRICS_GROUPS = os.getenv(
+    "PROCESS_METRICS_GROUPS",
+    "capella=capella,java;xpra=xpra,Xvfb*,Xorg;nginx=nginx;supervisord=supervisord",
+)
+# Comma-separated list of groups to report. If empty, all groups are reported.
+PROCESS_METRICS_ALLOWLIST = os.getenv("PROCESS_METRICS_ALLOWLIST", "")
+# Number of groups with the highest CPU usage to report. The remaining
+# processes are reported in the group `other`. Use 0 to report all groups.
+PROCESS_METRICS_TOP_N = int(os.getenv("PROCESS_METRICS_TOP_N", "20"))
 LOGGER = logging.getLogger(__file__)
 IDLETIME = prometheus_client.Gauge(
-    "idletime_minutes", "Idletime of X server in minutes from xprintidle"
+    "idletime_minutes", "Idletime of X server in minutes"
 )
 
 
+class XScreenSaverInfo(ctypes.Structure):
+    """`XScreenSaverInfo` struct of the X screensaver extension."""
+
+    _fields_ = [
+        ("window", ctypes.c_ulong),
+        ("state", ctypes.c_int),
+        ("kind", ctypes.c_int),
+        ("til_or_since", ctypes.c_ulong),
+        ("idle", ctypes.c_ulong),
+        ("event_mask", ctypes.c_ulong),
+    ]
+
+
+X_ERROR_HANDLER = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+X_IO_ERROR_HANDLER = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p)
+X_IO_ERROR_EXIT_HANDLER = ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.c_void_p)
+
+
+class XScreenSaver:
+    """Query the idle time from the X screensaver extension in-process.
+
+    This is the same query that xprintidle runs, but the connection to
+    the X server is kept open, so that a query doesn't start a process.
+
+    By default, Xlib exits the process on errors and if the connection
+    to the X server is lost. The error handlers installed here only mark
+    the connection as broken instead, so that it's reopened with the
+    next query. This requires `XSetIOErrorExitHandler` (libX11 1.7 and
+    later), otherwise xprintidle is used.
+    """
+
+    def __init__(self) -> None:
+        self._display: int | None = None
+        self._connection_lost = False
+        try:
+            self._xlib = ctypes.cdll.LoadLibrary(
+                ctypes.util.find_library("X11") or "libX11.so.6"
+            )
+            self._xss = ctypes.cdll.LoadLibrary(
+                ctypes.util.find_library("Xss") or "libXss.so.1"
+            )
+        except OSError:
+            LOGGER.info("libX11 or libXss not found, falling back to xprintidle")
+            self.available = False
+            return
+
+        if not hasattr(self._xlib, "XSetIOErrorExitHandler"):
+            LOGGER.info("libX11 is older than 1.7, falling back to xprintidle")
+            self.available = False
+            return
+
+        self._xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        self._xlib.XOpenDisplay.restype = ctypes.c_void_p
+        self._xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        self._xlib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        self._xlib.XDefaultRootWindow.restype = ctypes.c_ulong
+        self._xss.XScreenSaverQueryExtension.argtypes = [
+            ctypes.c_void_p,
+            ctypes.POINTER(ctypes.c_int),
+            ctypes.POINTER(ctypes.c_int),
+        ]
+        self._xss.XScreenSaverQueryExtension.restype = ctypes.c_int
+        self._xss.XScreenSaverQueryInfo.argtypes = [
+            ctypes.c_void_p,
+            ctypes.c_ulong,
+            ctypes.POINTER(XScreenSaverInfo),
+        ]
+        self._xss.XScreenSaverQueryInfo.restype = ctypes.c_int
+        self._xlib.XSetErrorHandler.argtypes = [X_ERROR_HANDLER]
+        self._xlib.XSetErrorHandler.restype = ctypes.c_void_p
+        self._xlib.XSetIOErrorHandler.argtypes = [X_IO_ERROR_HANDLER]
+        self._xlib.XSetIOErrorHandler.restype = ctypes.c_void_p
+        self._xlib.XSetIOErrorExitHandler.argtypes = [
+            ctypes.c_void_p,
+            X_IO_ERROR_EXIT_HANDLER,
+            ctypes.c_void_p,
+        ]
+        self._xlib.XSetIOErrorExitHandler.restype = None
+        self._info = XScreenSaverInfo()
+
+        # Keep references to the callbacks, Xlib only stores the pointers
+        self._error_handler = X_ERROR_HANDLER(self._handle_error)
+        self._io_error_handler = X_IO_ERROR_HANDLER(self._handle_io_error)
+        self._io_error_exit_handler = X_IO_ERROR_EXIT_HANDLER(
+            self._handle_io_error_exit
+        )
+        self._xlib.XSetErrorHandler(self._error_handler)
+        self._xlib.XSetIOErrorHandler(self._io_error_handler)
+        self.available = True
+
+    def _handle_error(self, _display: int, _event: int) -> int:
+        LOGGER.warning("The X server returned an error")
+        return 0
+
+    def _handle_io_error(self, _display: int) -> int:
+        LOGGER.warning("Lost the connection to the X server")
+        self._connection_lost = True
+        return 0
+
+    def _handle_io_error_exit(self, _display: int, _user_data: int) -> None:
+        # Returning from the handler prevents Xlib from exiting
+        self._connection_lost = True
+
+    def _open_display(self) -> int | None:
+        display = self._xlib.XOpenDisplay(None)
+        if not display:
+            LOGGER.debug("Couldn't open display")
+            return None
+        self._xlib.XSetIOErrorExitHandler(display, self._io_error_exit_handler, None)
+
+        event_base, error_base = ctypes.c_int(), ctypes.c_int()
+        if not self._xss.XScreenSaverQueryExtension(
+            display, ctypes.byref(event_base), ctypes.byref(error_base)
+        ):
+            LOGGER.warning("The X server doesn't support the screensaver extension")
+            self._xlib.XCloseDisplay(display)
+            return None
+        return display
+
+    def get_idle_ms(self) -> float | None:
+        """Return the idle time in milliseconds or None without display."""
+        if self._display is None:
+            self._display = self._open_display()
+            if self._display is None:
+                return None
+
+        self._connection_lost = False
+        succeeded = self._xss.XScreenSaverQueryInfo(
+            self._display,
+            self._xlib.XDefaultRootWindow(self._display),
+            ctypes.byref(self._info),
+        )
+        if self._connection_lost:
+            # The display is unusable, it's reopened with the next query
+            self._xlib.XCloseDisplay(self._display)
+            self._display = None
+            return None
+        if not succeeded:
+            return None
+        return float(self._info.idle)
+
+
 class IdleTimer:
-    """Measure the idle time of the X server even if there is no X server."""
+    """Measure the idle time of the X server even if there is no X server.
+
+    The metrics server handles scrapes in parallel. The display
+    connection and the last checkpoint are shared, so the measurements
+    are serialized with a lock.
+    """
 
     def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.screensaver = XScreenSaver()
         now = datetime.datetime.now()
-        self.first_checkpoint = (now, self._xprintidle(init=True) or -1.0)
+        self.first_checkpoint = (now, self._get_idle_minutes(init=True) or -1.0)
         self.last_checkpoint = self.first_checkpoint
 
-    def _xprintidle(self, *, init: bool = False) -> float:
+    def _xprintidle(self) -> float | None:
         proc = subprocess.run(
             ["xprintidle"], check=False, capture_output=True, encoding="utf-8"
         )
         LOGGER.debug("xprintidle's stdout: '%s'", proc.stdout)
         LOGGER.debug("xprintidle's stderr: '%r'", proc.stderr)
-        if proc.stdout in {"couldn't open display", ""}:
+        try:
+            return float(proc.stdout)
+        except ValueError:
+            return None
+
+    def _get_idle_minutes(self, *, init: bool = False) -> float:
+        if self.screensaver.available:
+            idle_ms = self.screensaver.get_idle_ms()
+        else:
+            idle_ms = self._xprintidle()
+
+        if idle_ms is None:
             if init or self.last_checkpoint[1] == -1.0:
                 LOGGER.debug("no display on init")
                 return -1.0
 
             checkpoint, idle_time = self.last_checkpoint
             delta = datetime.datetime.now() - checkpoint
-            return (delta + datetime.timedelta(seconds=idle_time)).seconds
+            return idle_time + delta.total_seconds() / 60
 
-        return float(proc.stdout) / 60000
+        return idle_ms / 60000
 
     def get_idletime(self) -> float:
         """Return idle time in minutes.
 
-        If there is an X server return output of xprintidle (Idle time
-        of X server in millisecs) in minutes. If there is no display the
-        idle time increases. Then the timedelta from now and the last
-        successfull xprintidle exec is returned.
+        If there is an X server return the idle time of the X server
+        from the screensaver extension (or xprintidle, if the libraries
+        aren't available) in minutes. If there is no display the idle
+        time increases. Then the timedelta from now and the last
+        successful query is returned.
         """
-        current_idle_time = self._xprintidle()
-        self.last_checkpoint = (datetime.datetime.now(), current_idle_time)
+        with self._lock:
+            current_idle_time = self._get_idle_minutes()
+            self.last_checkpoint = (datetime.datetime.now(), current_idle_time)
         return round(current_idle_time, 2)
 
 
+@dataclasses.dataclass(frozen=True)
+class ProcessSample:
+    """Metrics of a single process or group at the time of the last sample."""
+
+    name: str
+    cpu_percent: float
+    memory_rss: int
+    num_threads: int
+    io_read_bytes: int | None = None
+    io_write_bytes: int | None = None
+    num_fds: int | None = None
+    count: int = 1
+
+
+def _sum_optional(values: t.Iterable[int | None]) -> int | None:
+    known_values = [value for value in values if value is not None]
+    return sum(known_values) if known_values else None
+
+
+def aggregate_samples(name: str, samples: list[ProcessSample]) -> ProcessSample:
+    """Sum up the metrics of several processes."""
+    return ProcessSample(
+        name=name,
+        cpu_percent=sum(sample.cpu_percent for sample in samples),
+        memory_rss=sum(sample.memory_rss for sample in samples),
+        num_threads=sum(sample.num_threads for sample in samples),
+        io_read_bytes=_sum_optional(sample.io_read_bytes for sample in samples),
+        io_write_bytes=_sum_optional(sample.io_write_bytes for sample in samples),
+        num_fds=_sum_optional(sample.num_fds for sample in samples),
+        count=sum(sample.count for sample in samples),
+    )
+
+
+def parse_process_groups(value: str) -> dict[str, list[str]]:
+    """Parse groups in the format `group=pattern,pattern;group=pattern`."""
+    groups: dict[str, list[str]] = {}
+    for group in value.split(";"):
+        name, _, patterns = group.partition("=")
+        if name.strip():
+            groups[name.strip()] = [
+                pattern.strip() for pattern in patterns.split(",") if pattern.strip()
+            ]
+    return groups
+
+
+class ProcessAggregator:
+    """Roll up the samples of processes with the same name or group.
+
+    Each process is assigned to the first group with a matching pattern.
+    Processes without group are grouped by their name. Only groups in the
+    allowlist are kept. If there are more than `top_n` groups, the groups
+    with the lowest CPU usage are combined into the group `other`.
+    """
+
+    OTHER = "other"
+
+    def __init__(
+        self,
+        groups: dict[str, list[str]],
+        allowlist: t.Collection[str] = (),
+        top_n: int = 0,
+    ) -> None:
+        self.groups = groups
+        self.allowlist = set(allowlist)
+        self.top_n = top_n
+        self._group_names: dict[str, str] = {}
+
+    def get_group(self, process_name: str) -> str:
+        if (group := self._group_names.get(process_name)) is None:
+            group = next(
+                (
+                    name
+                    for name, patterns in self.groups.items()
+                    if any(
+                        fnmatch.fnmatchcase(process_name, pattern)
+                        for pattern in patterns
+                    )
+                ),
+                process_name,
+            )
+            self._group_names[process_name] = group
+        return group
+
+    def aggregate(self, samples: list[ProcessSample]) -> list[ProcessSample]:
+        grouped_samples: dict[str, list[ProcessSample]] = {}
+        for sample in samples:
+            group = self.get_group(sample.name)
+            if self.allowlist and group not in self.allowlist:
+                continue
+            grouped_samples.setdefault(group, []).append(sample)
+
+        aggregated = sorted(
+            (
+                aggregate_samples(group, group_samples)
+                for group, group_samples in grouped_samples.items()
+            ),
+            key=lambda sample: (sample.cpu_percent, sample.memory_rss),
+            reverse=True,
+        )
+        if self.top_n <= 0 or len(aggregated) <= self.top_n:
+            return aggregated
+
+        # A group that is already called `other` is merged into the rest
+        top = [sample for sample in aggregated if sample.name != self.OTHER]
+        rest = [sample for sample in aggregated if sample.name == self.OTHER]
+        return [
+            *top[: self.top_n],
+            aggregate_samples(self.OTHER, top[self.top_n :] + rest),
+        ]
+
+
+class ProcessSampler:
+    """Sample all system processes in a background thread.
+
+    The `psutil.Process` handles are kept between samples, so that
+    `cpu_percent` measures the CPU usage since the previous sample.
+    Scrapes are served from the last snapshot and don't touch the
+    processes. The snapshot contains the aggregated process groups.
+    """
+
+    def __init__(self, interval: float, aggregator: ProcessAggregator) -> None:
+        self.interval = interval
+        self.aggregator = aggregator
+        self._processes: dict[int, psutil.Process] = {}
+        self._snapshot: list[ProcessSample] = []
+        self._lock = threading.Lock()
+
+    def _sample_process(self, process: psutil.Process) -> ProcessSample:
+        with process.oneshot():
+            io_counters = None
+            with contextlib.suppress(psutil.AccessDenied):
+                io_counters = process.io_counters()
+
+            num_fds = None
+            if hasattr(process, "num_fds"):
+                with contextlib.suppress(psutil.AccessDenied):
+                    num_fds = process.num_fds()
+
+            return ProcessSample(
+                name=process.name(),
+                cpu_percent=process.cpu_percent(),
+                memory_rss=process.memory_info().rss,
+                num_threads=process.num_threads(),
+                io_read_bytes=io_counters.read_bytes if io_counters else None,
+                io_write_bytes=io_counters.write_bytes if io_counters else None,
+                num_fds=num_fds,
+            )
+
+    def sample(self) -> None:
+        """Take a new snapshot of all processes."""
+        processes: dict[int, psutil.Process] = {}
+        snapshot: list[ProcessSample] = []
+        for pid in psutil.pids():
+            process = self._processes.get(pid)
+            try:
+                # The PID may have been reused by a new process
+                if process is None or not process.is_running():
+                    process = psutil.Process(pid)
+                snapshot.append(self._sample_process(process))
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            processes[pid] = process
+
+        self._processes = processes
+        aggregated_snapshot = self.aggregator.aggregate(snapshot)
+        with self._lock:
+            self._snapshot = aggregated_snapshot
+
+    def get_snapshot(self) -> list[ProcessSample]:
+        with self._lock:
+            return self._snapshot
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.sample()
+            except Exception:
+                LOGGER.exception("Failed to sample the processes")
+            time.sleep(self.interval)
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, daemon=True).start()
+
+
+class XpraInfoSampler:
+    """Refresh the output of `xpra info` in a background thread.
+
+    `xpra info` starts a new Python process, which is too expensive to
+    run on every scrape. The output is parsed once per refresh, and
+    scrapes are served from the last snapshot.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._snapshot: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def sample(self) -> None:
+        """Run `xpra info` and store the parsed output."""
+        try:
+            proc = subprocess.run(
+                ["xpra", "info"],
+                check=False,
+                capture_output=True,
+                encoding="utf-8",
+                timeout=max(self.interval, 5),
+            )
+            stdout = proc.stdout
+        except subprocess.TimeoutExpired:
+            LOGGER.warning("xpra info didn't respond in time")
+            stdout = ""
+
+        snapshot = {}
+        for line in stdout.splitlines():
+            key, separator, value = line.partition("=")
+            if separator:
+                snapshot[key] = value
+
+        with self._lock:
+            self._snapshot = snapshot
+
+    def get_snapshot(self) -> dict[str, str]:
+        with self._lock:
+            return self._snapshot
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.sample()
+            except Exception:
+                LOGGER.exception("Failed to query xpra info")
+            time.sleep(self.interval)
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, daemon=True).start()
+
+
 class ProcessCollector(prometheus_client.registry.Collector):
-    """Track metrics of all system processes."""
+    """Track metrics of all system processes, aggregated by group."""
 
-    def collect(self) -> t.Iterable[prometheus_client.Metric]:
-        """Collect metrics from all system processes."""
-        processes = psutil.process_iter()
+    def __init__(self, sampler: ProcessSampler) -> None:
+        self.sampler = sampler
 
+    def collect(self) -> t.Iterable[prometheus_client.Metric]:
+        """Collect metrics from the last snapshot of the system processes."""
         process_cpu_percent_metric = prometheus_client.metrics_core.GaugeMetricFamily(
             "process_cpu_percent",
             "CPU percent of the process",
@@ -96,49 +519,47 @@ class ProcessCollector(prometheus_client.registry.Collector):
             labels=["process_name"],
         )
 
-        for process in processes:
-            with process.oneshot():
-                process_cpu_percent_metric.add_metric(
-                    [process.name()], process.cpu_percent()
-                )
-
-                process_memory_usage_metric.add_metric(
-                    [process.name()], process.memory_info().rss
-                )
+        process_count_metric = prometheus_client.metrics_core.GaugeMetricFamily(
+            "process_count",
+            "Number of processes in the group",
+            labels=["process_name"],
+        )
 
-                try:
-                    io_counters = process.io_counters()
-                except psutil.AccessDenied:
-                    io_counters = None
+        for process in self.sampler.get_snapshot():
+            process_cpu_percent_metric.add_metric([process.name], process.cpu_percent)
 
-                if io_counters:
-                    process_io_counters_metric.add_metric(
-                        [process.name(), "read"], io_counters.read_bytes
-                    )
-                    process_io_counters_metric.add_metric(
-                        [process.name(), "write"], io_counters.write_bytes
-                    )
+            process_memory_usage_metric.add_metric([process.name], process.memory_rss)
 
-                process_num_threads_metric.add_metric(
-                    [process.name()], process.num_threads()
+            if process.io_read_bytes is not None:
+                process_io_counters_metric.add_metric(
+                    [process.name, "read"], process.io_read_bytes
                 )
+            if process.io_write_bytes is not None:
+                process_io_counters_metric.add_metric(
+                    [process.name, "write"], process.io_write_bytes
+                )
+
+            process_num_threads_metric.add_metric([process.name], process.num_threads)
+
+            if process.num_fds is not None:
+                process_open_fds_metric.add_metric([process.name], process.num_fds)
 
-                if hasattr(process, "num_fds"):
-                    with contextlib.suppress(psutil.AccessDenied):
-                        process_open_fds_metric.add_metric(
-                            [process.name()], process.num_fds()
-                        )
+            process_count_metric.add_metric([process.name], process.count)
 
         yield process_cpu_percent_metric
         yield process_memory_usage_metric
         yield process_io_counters_metric
         yield process_num_threads_metric
         yield process_open_fds_metric
+        yield process_count_metric
 
 
 class XpraCollector(prometheus_client.registry.Collector):
+    def __init__(self, sampler: XpraInfoSampler) -> None:
+        self.sampler = sampler
+
     def collect(self) -> t.Iterable[prometheus_client.Metric]:
-        """Collect metrics from xpra info command output."""
+        """Collect metrics from the last xpra info command output."""
         client_batch_delay_metric = prometheus_client.metrics_core.GaugeMetricFamily(
             "xpra_client_batch_delay_ms",
             "Batch delay in ms",
@@ -195,18 +616,7 @@ class XpraCollector(prometheus_client.registry.Collector):
             "Jitter of xpra client in milliseconds",
         )
 
-        proc = subprocess.run(
-            ["xpra", "info"],
-            check=False,
-            capture_output=True,
-            encoding="utf-8",
-        )
-
-        xpra_metrics = {
-            line.split("=")[0]: line.split("=")[1]
-            for line in proc.stdout.splitlines()
-            if "=" in line
-        }
+        xpra_metrics = self.sampler.get_snapshot()
 
         types = ["50p", "80p", "90p", "avg", "cur", "max", "min"]
         for metric_type in types:
@@ -260,9 +670,53 @@ class XpraCollector(prometheus_client.registry.Collector):
 
 IDLETIME.set_function(IdleTimer().get_idletime)
 
-prometheus_client.REGISTRY.register(ProcessCollector())
+process_sampler = ProcessSampler(
+    PROCESS_METRICS_INTERVAL,
+    ProcessAggregator(
+        parse_process_groups(PROCESS_METRICS_GROUPS),
+        allowlist=[
+            group.strip()
+            for group in PROCESS_METRICS_ALLOWLIST.split(",")
+            if group.strip()
+        ],
+        top_n=PROCESS_METRICS_TOP_N,
+    ),
+)
+process_sampler.start()
+prometheus_client.REGISTRY.register(ProcessCollector(process_sampler))
 if os.getenv("CONNECTION_METHOD", "").lower() == "xpra":
-    prometheus_client.REGISTRY.register(XpraCollector())
+    xpra_info_sampler = XpraInfoSampler(XPRA_METRICS_INTERVAL)
+    xpra_info_sampler.start()
+    prometheus_client.REGISTRY.register(XpraCollector(xpra_info_sampler))
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, simple_server.WSGIServer):
+    """WSGI server which handles each request in a separate thread."""
+
+    daemon_threads = True
+
+
+def make_app(
+    registry: prometheus_client.registry.CollectorRegistry,
+) -> wsgi_types.WSGIApplication:
+    """Create a WSGI app for the metrics and a liveness endpoint.
+
+    `/healthz` responds without running any collector, so that probes
+    don't time out if a collector is slow. All other paths return the
+    metrics, gzip-compressed if the client accepts it.
+    """
+    metrics_app = prometheus_client.make_wsgi_app(registry)
+
+    def app(
+        environ: wsgi_types.WSGIEnvironment,
+        start_response: wsgi_types.StartResponse,
+    ) -> t.Iterable[bytes]:
+        if environ.get("PATH_INFO") == "/healthz":
+            start_response("200 OK", [("Content-Type", "text/plain")])
+            return [b"OK"]
+        return metrics_app(environ, start_response)
+
+    return app
 
 
 def start_server(
@@ -270,9 +724,10 @@ def start_server(
     port: int,
     registry: prometheus_client.registry.CollectorRegistry,
 ) -> None:
-    """Start a WSGI server for Prometheus metrics on the main thread."""
-    app = prometheus_client.make_wsgi_app(registry)
-    httpd = simple_server.make_server(addr, port, app)
+    """Start a threaded WSGI server for Prometheus metrics."""
+    httpd = simple_server.make_server(
+        addr, port, make_app(registry), server_class=ThreadingWSGIServer
+    )
     httpd.serve_forever()
 
 
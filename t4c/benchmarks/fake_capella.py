@@ -0,0 +1,200 @@
+# SPDX-FileCopyrightText: Copyright DB InfraGO AG and contributors
+# SPDX-License-Identifier: Apache-2.0
+
+"""Stub for the TeamForCapella importer application of Capella.
+
+The stub accepts the same arguments as Capella and writes a synthetic
+project archive and commit history to the output folder. Use it with
+`CDI_CAPELLA_COMMAND` to measure the backup pipeline without a
+TeamForCapella server.
+
+The size of the synthetic project is configured with environment
+variables:
+
+- `CDI_BENCHMARK_ACTIVITIES`: number of activities in the history.
+- `CDI_BENCHMARK_FILES`: number of files in the project.
+- `CDI_BENCHMARK_FILE_SIZE`: size of each file in bytes.
+- `CDI_BENCHMARK_CHANGED_FILES`: number of files changed per activity.
+- `CDI_BENCHMARK_STARTUP_SECONDS`: simulated startup time of Capella.
+
+The content is deterministic, the same checkout always produces the
+same files.
+"""
+
+from __future__ import annotations
+
+import datetime
+import json
+import os
+import pathlib
+import random
+import sys
+import time
+import zipfile
+
+ACTIVITIES = int(os.getenv("CDI_BENCHMARK_ACTIVITIES", "20"))
+FILES = int(os.getenv("CDI_BENCHMARK_FILES", "50"))
+FILE_SIZE = int(os.getenv("CDI_BENCHMARK_FILE_SIZE", "100000"))
+CHANGED_FILES = int(os.getenv("CDI_BENCHMARK_CHANGED_FILES", "3"))
+STARTUP_SECONDS = float(os.getenv("CDI_BENCHMARK_STARTUP_SECONDS", "0"))
+
+FIRST_ACTIVITY = datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC)
+ACTIVITY_INTERVAL = datetime.timedelta(hours=1)
+
+IMPORTER_APPLICATION = "com.thalesgroup.mde.melody.collab.importer"
+
+
+def parse_arguments(argv: list[str]) -> dict[str, str]:
+    """Parse the `-key value` arguments of Capella.
+
+    Flags without value, like `-nosplash`, are ignored.
+    """
+
+    arguments: dict[str, str] = {}
+    idx = 0
+    while idx < len(argv):
+        key = argv[idx]
+        if (
+            key.startswith("-")
+            and idx + 1 < len(argv)
+            and not argv[idx + 1].startswith("-")
+        ):
+            arguments[key.lstrip("-")] = argv[idx + 1]
+            idx += 2
+        else:
+            idx += 1
+    return arguments
+
+
+def parse_t4c_datetime(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value).replace(tzinfo=datetime.UTC)
+
+
+def get_activity_date(activity: int) -> datetime.datetime:
+    return FIRST_ACTIVITY + activity * ACTIVITY_INTERVAL
+
+
+def get_changed_files(activity: int) -> list[int]:
+    return [
+        (activity * CHANGED_FILES + offset) % FILES
+        for offset in range(min(CHANGED_FILES, FILES))
+    ]
+
+
+def get_file_name(project: str, file: int) -> str:
+    if file == 0:
+        return f"{project}/{project}.aird"
+    if file == 1:
+        return f"{project}/{project}.capella"
+    return f"{project}/fragments/fragment-{file}.capellafragment"
+
+
+def get_file_content(file: int, revision: int) -> bytes:
+    """Generate XML-like content, which compresses like a real model."""
+
+    rng = random.Random(file * 1_000_003 + revision)
+    lines: list[bytes] = []
+    size = 0
+    while size < FILE_SIZE:
+        line = (
+            f'  <ownedElements xsi:type="org.polarsys.capella.core.data.la:'
+            f'LogicalComponent" id="{rng.getrandbits(128):032x}"'
+            f' name="Component {rng.randrange(10_000)}"/>\n'
+        ).encode()
+        lines.append(line)
+        size += len(line)
+    return b"".join(lines)[:FILE_SIZE]
+
+
+def get_file_revisions(checkout: datetime.datetime | None) -> list[int]:
+    """Return how often each file was changed up to the checkout."""
+
+    revisions = [0] * FILES
+    for activity in range(ACTIVITIES):
+        if checkout is not None and get_activity_date(activity) > checkout:
+            break
+        for file in get_changed_files(activity):
+            revisions[file] += 1
+    return revisions
+
+
+def write_commit_history(
+    output_folder: pathlib.Path,
+    project: str,
+    since: datetime.datetime | None,
+    until: datetime.datetime | None,
+) -> int:
+    activities = [
+        {
+            "date": get_activity_date(activity).isoformat(),
+            "description": f"Activity {activity}",
+            "user": f"user-{activity % 5}",
+        }
+        for activity in range(ACTIVITIES)
+        if (since is None or get_activity_date(activity) >= since)
+        and (until is None or get_activity_date(activity) <= until)
+    ]
+    activities.reverse()
+
+    (output_folder / f"CommitHistory__{project}.json").write_text(
+        json.dumps({"activityMetadataExport": {"activities": activities}}),
+        encoding="utf-8",
+    )
+    return len(activities)
+
+
+def write_project_archive(
+    output_folder: pathlib.Path,
+    project: str,
+    checkout: datetime.datetime | None,
+) -> None:
+    timestamp = datetime.datetime.now(datetime.UTC).strftime("%Y%m%d_%H%M%S")
+    with zipfile.ZipFile(
+        output_folder / f"{project}_{timestamp}.zip",
+        "w",
+        compression=zipfile.ZIP_DEFLATED,
+        compresslevel=1,
+    ) as archive:
+        for file, revision in enumerate(get_file_revisions(checkout)):
+            archive.writestr(
+                get_file_name(project, file),
+                get_file_content(file, revision),
+            )
+
+
+def main() -> int:
+    arguments = parse_arguments(sys.argv[1:])
+    application = arguments.get("application")
+    if application != IMPORTER_APPLICATION:
+        print(f"Unsupported application: {application}", file=sys.stderr)
+        return 1
+
+    time.sleep(STARTUP_SECONDS)
+
+    project = arguments["projectName"]
+    output_folder = pathlib.Path(arguments["outputFolder"])
+    output_folder.mkdir(parents=True, exist_ok=True)
+
+    since = until = checkout = None
+    if "from" in arguments:
+        since = parse_t4c_datetime(arguments["from"])
+        until = parse_t4c_datetime(arguments["to"])
+    if "checkout" in arguments:
+        checkout = parse_t4c_datetime(arguments["checkout"])
+
+    print(f"!MESSAGE Importing project {project}", flush=True)
+    activities = write_commit_history(output_folder, project, since, until)
+    print(f"!MESSAGE {activities} activities exported", flush=True)
+
+    if arguments.get("importType") == "COMMIT_HISTORY_ONLY":
+        print("1 project import succeeded", flush=True)
+        return 0
+
+    write_project_archive(output_folder, project, checkout)
+    print("1 project import succeeded", flush=True)
+    print("1 archiving succeeded", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+# SPDX-FileCopyrightText: Copyright DB InfraGO AG and contributors
+# SPDX-License-Identifier: Apache-2.0
+
+"""Benchmark the backup pipeline against a stub Capella importer.
+
+Each scenario runs a full backup with `fake_capella.py` as Capella
+executable and pushes to a fresh branch of a Git server, e.g. the
+`local-git-server` of this repository. The per-phase metrics of the
+runs are collected and printed as table.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import pathlib
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+import typing as t
+
+import click
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+log = logging.getLogger("Benchmark")
+
+FAKE_CAPELLA = pathlib.Path(__file__).parent / "fake_capella.py"
+
+SCENARIOS: dict[str, dict[str, str]] = {
+    "grouped": {"CDI_COMMIT_MAPPING": "grouped"},
+    "exact": {
+        "CDI_COMMIT_MAPPING": "exact",
+        "CDI_EXACT_MAPPING_MAX_BATCHES": "0",
+    },
+}
+
+
+def _parse_environment(
+    _ctx: click.Context, _param: click.Parameter, values: tuple[str, ...]
+) -> dict[str, str]:
+    environment = {}
+    for value in values:
+        key, separator, variable_value = value.partition("=")
+        if not separator:
+            raise click.BadParameter(
+                f"'{value}' has to be in the format KEY=VALUE"
+            )
+        environment[key] = variable_value
+    return environment
+
+
+def _prepare_home(home: pathlib.Path) -> None:
+    """Create a Git configuration that the backup is allowed to modify.
+
+    The backup unsets `core.hooksPath` in the global configuration,
+    which fails if the option isn't set.
+    """
+
+    home.mkdir(parents=True)
+    (home / ".gitconfig").write_text(
+        "[core]\n\thooksPath = hooks\n", encoding="utf-8"
+    )
+
+
+def run_backup(
+    scenario: str,
+    run: int,
+    environment: dict[str, str],
+    work_dir: pathlib.Path,
+) -> dict[str, t.Any]:
+    """Run a single backup and return its metrics report."""
+
+    home = work_dir / "home"
+    _prepare_home(home)
+    report_path = work_dir / "report.json"
+
+    backup_environment = (
+        dict(os.environ)
+        | {
+            "HOME": str(home),
+            "CAPELLA_VERSION": "7.0.0",
+            "CDI_CAPELLA_COMMAND": shlex.join(
+                [sys.executable, str(FAKE_CAPELLA)]
+            ),
+            "CDI_CAPELLA_DIR": str(work_dir),
+            "CDI_WORK_DIR": str(work_dir),
+            "CDI_METRICS_REPORT": str(report_path),
+            "FILE_HANDLER": "GIT",
+            "T4C_REPO_HOST": "localhost",
+            "T4C_REPO_NAME": "benchmark",
+            "T4C_PROJECT_NAME": "benchmark",
+            "T4C_USERNAME": "benchmark",
+            "T4C_PASSWORD": "benchmark",
+            "GIT_EMAIL": "benchmark@example.com",
+            "GIT_USERNAME": "benchmark",
+        }
+        | SCENARIOS[scenario]
+        | environment
+    )
+
+    log.info("Running scenario %s (run %d)", scenario, run)
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-m", "t4c_cli.backup"],
+        check=False,
+        cwd=pathlib.Path(__file__).parents[1],
+        env=backup_environment,
+        capture_output=True,
+        text=True,
+    )
+    duration = time.perf_counter() - start
+
+    if result.returncode != 0:
+        log.error(
+            "Scenario %s failed:\n%s", scenario, result.stdout + result.stderr
+        )
+        raise click.ClickException(f"Scenario {scenario} failed")
+
+    report = json.loads(report_path.read_text(encoding="utf-8"))
+    return {
+        "scenario": scenario,
+        "run": run,
+        "wall_time_seconds": duration,
+        "environment": SCENARIOS[scenario] | environment,
+        "phases": report["phases"],
+    }
+
+
+def print_results(results: list[dict[str, t.Any]]) -> None:
+    phases = sorted({phase for r in results for phase in r["phases"]})
+    header = ["scenario", "run", "total", *phases]
+    rows = [
+        [
+            result["scenario"],
+            str(result["run"]),
+            f"{result['wall_time_seconds']:.2f}s",
+            *(
+                f"{result['phases'][phase]['duration_seconds']:.2f}s"
+                if phase in result["phases"]
+                else "-"
+                for phase in phases
+            ),
+        ]
+        for result in results
+    ]
+    widths = [
+        max(len(row[column]) for row in [header, *rows])
+        for column in range(len(header))
+    ]
+    for row in [header, *rows]:
+        print(
+            "  ".join(
+                value.ljust(width)
+                for value, width in zip(row, widths, strict=True)
+            ).rstrip()
+        )
+
+
+@click.command()
+@click.option(
+    "--git-repo-url",
+    default="http://localhost:10001/git/git-test-repo.git",
+    show_default=True,
+    help="Git repository to push to. Every run uses a new branch.",
+)
+@click.option(
+    "--scenario",
+    "scenarios",
+    type=click.Choice(list(SCENARIOS)),
+    multiple=True,
+    default=list(SCENARIOS),
+    show_default=True,
+)
+@click.option("--runs", default=1, show_default=True, type=click.IntRange(1))
+@click.option("--activities", default=20, show_default=True, type=int)
+@click.option("--files", default=50, show_default=True, type=int)
+@click.option(
+    "--file-size",
+    default=100_000,
+    show_default=True,
+    type=int,
+    help="Size of each model file in bytes.",
+)
+@click.option(
+    "--changed-files",
+    default=3,
+    show_default=True,
+    type=int,
+    help="Number of files changed by each activity.",
+)
+@click.option(
+    "--startup-seconds",
+    default=0.0,
+    show_default=True,
+    type=float,
+    help="Simulated startup time of each Capella process.",
+)
+@click.option(
+    "--env",
+    "environment",
+    multiple=True,
+    callback=_parse_environment,
+    help="Additional environment variable for the backup, e.g. GIT_PUSH_INTERVAL=10.",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, path_type=pathlib.Path),
+    help="Write the results as JSON to this file.",
+)
+def benchmark(
+    git_repo_url: str,
+    scenarios: tuple[str, ...],
+    runs: int,
+    activities: int,
+    files: int,
+    file_size: int,
+    changed_files: int,
+    startup_seconds: float,
+    environment: dict[str, str],
+    output: pathlib.Path | None,
+) -> None:
+    benchmark_id = time.strftime("%Y%m%d-%H%M%S")
+    environment = {
+        "CDI_BENCHMARK_ACTIVITIES": str(activities),
+        "CDI_BENCHMARK_FILES": str(files),
+        "CDI_BENCHMARK_FILE_SIZE": str(file_size),
+        "CDI_BENCHMARK_CHANGED_FILES": str(changed_files),
+        "CDI_BENCHMARK_STARTUP_SECONDS": str(startup_seconds),
+        "GIT_REPO_URL": git_repo_url,
+    } | environment
+
+    results = []
+    for scenario in scenarios:
+        for run in range(1, runs + 1):
+            with tempfile.TemporaryDirectory(prefix="cdi-benchmark-") as tmp:
+                results.append(
+                    run_backup(
+                        scenario,
+                        run,
+                        environment
+                        | {
+                            "GIT_REPO_BRANCH": f"benchmark/{benchmark_id}/{scenario}-{run}"
+                        },
+                        pathlib.Path(tmp),
+                    )
+                )
+
+    print_results(results)
+    if output:
+        output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    benchmark()
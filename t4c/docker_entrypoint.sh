@@ -10,10 +10,18 @@ case ${1:-startup} in
     xvfb-run $VIRTUAL_ENV/bin/backup
     ;;
 
+  backup-all)
+    xvfb-run $VIRTUAL_ENV/bin/backup-all
+    ;;
+
   export)
     xvfb-run $VIRTUAL_ENV/bin/exporter
     ;;
 
+  export-all)
+    xvfb-run $VIRTUAL_ENV/bin/export-all
+    ;;
+
   startup)
     /startup.sh
     ;;
@@ -1,25 +1,28 @@
 # SPDX-FileCopyrightText: Copyright DB InfraGO AG and contributors
 # SPDX-License-Identifier: Apache-2.0
 
+import collections
 import datetime
-import json
 import logging
 import os
 import pathlib
-import re
 import shutil
-import subprocess
 import typing as t
 import urllib.parse
+from concurrent import futures
 
 import click
 import yaml
 
+from .util import archive as util_archive
 from .util import capella as util_capella
 from .util import config
 from .util import datetime as util_datetime
+from .util import events as util_events
 from .util import git as util_git
-from .util import log as util_log
+from .util import history as util_history
+from .util import metrics as util_metrics
+from .util import retry as util_retry
 from .util import t4c as util_t4c
 
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
@@ -30,6 +33,7 @@ def _build_backup_command(
     last_backup_commit_datetime: datetime.datetime | None,
     commit_history_only: bool = False,
     checkout: datetime.datetime | None = None,
+    output_folder: str | None = None,
 ) -> list[str]:
     t4c_config = config.config.t4c
 
@@ -44,14 +48,10 @@ def _build_backup_command(
         t4c_config.repo_name,
         "-projectName",
         urllib.parse.quote(t4c_config.project_name, safe="@"),
-        (
-            "-importerCredentials"
-            if util_capella.is_capella_5_x_x()
-            else "-repositoryCredentials"
-        ),
+        util_capella.get_capella_version().credentials_argument,
         t4c_config.credentials_file_path,
         "-outputFolder",
-        t4c_config.project_dir_path,
+        output_folder or t4c_config.project_dir_path,
         "-archiveProject",
         "true",
         "-overrideExistingProject",
@@ -62,7 +62,10 @@ def _build_backup_command(
         "false",
     ]
 
-    if util_capella.is_capella_7_x_x() and commit_history_only:
+    if (
+        commit_history_only
+        and util_capella.get_capella_version().supports_commit_history_only_import
+    ):
         command += [
             "-importType",
             "COMMIT_HISTORY_ONLY",
@@ -89,19 +92,16 @@ def _build_backup_command(
     return command
 
 
-def _validate_backup_stdout(line: str) -> None:
-    if (
-        re.search(r"project .+ not found on the repository .+\.", line)
-        or "No project found!" in line
-    ):
+def _handle_importer_event(event: util_events.Event) -> None:
+    if event.type == util_events.EventType.PROJECT_NOT_FOUND:
         log.warning(
             "Project not found in the repository."
             " This is expected if the referenced revision relates to another project in the repository.",
         )
         raise ProjectNotFoundError()
-    if re.search(r"[1-9][0-9]* projects? imports? failed", line):
+    if event.type == util_events.EventType.IMPORT_FAILED:
         raise RuntimeError("Backup failed. Please check the logs above.")
-    if re.search(r"[1-9][0-9]* archivings? failed", line):
+    if event.type == util_events.EventType.ARCHIVING_FAILED:
         raise RuntimeError(
             f"Failed to create archives in output folder ({config.config.t4c.project_dir_path})"
         )
@@ -110,11 +110,16 @@ def _validate_backup_stdout(line: str) -> None:
 def fetch_t4c_commit_history(
     last_backup_commit_datetime: datetime.datetime | None,
 ) -> None:
-    util_capella.run_capella_command_and_handle_errors(
-        "com.thalesgroup.mde.melody.collab.importer",
-        _build_backup_command(
-            last_backup_commit_datetime, commit_history_only=True
+    util_retry.call_with_retries(
+        lambda: util_capella.run_capella_command_and_handle_errors(
+            "com.thalesgroup.mde.melody.collab.importer",
+            _build_backup_command(
+                last_backup_commit_datetime, commit_history_only=True
+            ),
         ),
+        description="Fetching the T4C commit history",
+        retry_on=(util_capella.TransientCapellaError,),
+        before_retry=clean_and_create_t4c_project_dir,
     )
 
 
@@ -125,62 +130,114 @@ class ProjectNotFoundError(Exception):
 def run_importer_script(
     last_backup_commit_datetime: datetime.datetime | None = None,
     checkout: datetime.datetime | None = None,
+    output_folder: str | None = None,
+    workspace: str = util_capella.DEFAULT_CAPELLA_WORKSPACE,
 ) -> None:
     log.debug("Import model from TeamForCapella server...")
 
-    stdout, _ = util_capella.run_capella_command_and_handle_errors(
-        "com.thalesgroup.mde.melody.collab.importer",
-        _build_backup_command(last_backup_commit_datetime, checkout=checkout),
-        _validate_backup_stdout,
+    util_retry.call_with_retries(
+        lambda: _run_importer_script_once(
+            last_backup_commit_datetime, checkout, output_folder, workspace
+        ),
+        description="Import of model from TeamForCapella server",
+        retry_on=(util_capella.TransientCapellaError,),
+        before_retry=lambda: clean_and_create_directory(
+            pathlib.Path(output_folder or config.config.t4c.project_dir_path)
+        ),
     )
 
-    if util_capella.is_capella_5_0_x():
-        if not re.search(r"!MESSAGE [1-9][0-9]* Succeeded", stdout):
-            raise RuntimeError(
-                "'!MESSAGE [1-9][0-9]* Succeeded' not found in logs"
-            )
-    else:
-        if not re.search(r"[1-9][0-9]* projects? imports? succeeded", stdout):
-            raise RuntimeError(
-                "'[1-9][0-9]* projects? imports? succeeded' not found in logs"
-            )
-        if not re.search(r"[1-9][0-9]* archivings? succeeded", stdout):
-            raise RuntimeError(
-                "'[1-9][0-9]* archivings? succeeded' not found in logs"
-            )
-
     log.info("Import of model from TeamForCapella server finished")
 
 
-def unzip_exported_files() -> None:
-    project_dir = pathlib.Path(config.config.t4c.project_dir_path)
+def _run_importer_script_once(
+    last_backup_commit_datetime: datetime.datetime | None,
+    checkout: datetime.datetime | None,
+    output_folder: str | None,
+    workspace: str,
+) -> None:
+    expected_events = (
+        {util_events.EventType.LEGACY_SUCCEEDED}
+        if util_capella.get_capella_version().has_legacy_import_summary
+        else {
+            util_events.EventType.IMPORT_SUCCEEDED,
+            util_events.EventType.ARCHIVING_SUCCEEDED,
+        }
+    )
+    missing_events = set(expected_events)
+
+    def handle_event(event: util_events.Event) -> None:
+        _handle_importer_event(event)
+        missing_events.discard(event.type)
+
+    with util_metrics.span("import") as import_span:
+        util_capella.run_capella_command_and_handle_errors(
+            "com.thalesgroup.mde.melody.collab.importer",
+            _build_backup_command(
+                last_backup_commit_datetime,
+                checkout=checkout,
+                output_folder=output_folder,
+            ),
+            handle_event,
+            workspace=workspace,
+        )
 
-    log.info("Start unzipping project archive in %s", project_dir)
+        if missing_events:
+            raise RuntimeError(
+                "Success message not found in logs: "
+                + ", ".join(sorted(event.name for event in missing_events))
+            )
 
-    project_file_to_unzip = util_t4c.get_single_file_by_t4c_pattern_or_raise(
+        import_span.files, import_span.bytes = util_metrics.get_directory_size(
+            pathlib.Path(output_folder or config.config.t4c.project_dir_path)
+        )
+
+
+def _find_project_archive(project_dir: pathlib.Path) -> pathlib.Path:
+    return project_dir / util_t4c.get_single_file_by_t4c_pattern_or_raise(
         prefix=config.config.t4c.project_name,
         file_format="zip",
         root_dir=project_dir,
     )
 
-    try:
-        subprocess.run(
-            ["unzip", project_file_to_unzip], check=True, cwd=project_dir
+
+def unzip_exported_files() -> None:
+    project_dir = pathlib.Path(config.config.t4c.project_dir_path)
+
+    log.info("Start unzipping project archive in %s", project_dir)
+
+    project_file_to_unzip = _find_project_archive(project_dir)
+    with util_metrics.span("unzip") as unzip_span:
+        stats = util_archive.extract_zip_into_directory(
+            project_file_to_unzip, project_dir
         )
-    except subprocess.CalledProcessError as e:
-        util_log.log_subprocess_error(e.returncode, e.cmd, e.stdout, e.stderr)
-        raise e
+        unzip_span.files = stats.written + stats.skipped
+        unzip_span.bytes = stats.bytes_written
 
     log.info("Finished unzipping %s", project_file_to_unzip)
 
 
-def copy_exported_files_into_git_repo() -> None:
+def copy_exported_files_into_git_repo(
+    project_dir: pathlib.Path | None = None,
+) -> None:
+    """Synchronize the exported project archive into the Git repository.
+
+    The archive is extracted directly into the model directory. Files
+    with the same content as in the Git index are skipped and keep their
+    modification time. If `CDI_DELETE_REMOVED_FILES` is enabled, tracked
+    files that are no longer part of the project are deleted.
+
+    The archive has to contain the project folder, otherwise a
+    `FileNotFoundError` is raised and nothing is changed in the Git
+    repository.
+    """
+
     log.info("Start copying files...")
 
     git_config = config.config.git
     t4c_config = config.config.t4c
 
-    project_dir = pathlib.Path(t4c_config.project_dir_path)
+    if project_dir is None:
+        project_dir = pathlib.Path(t4c_config.project_dir_path)
 
     target_directory = util_capella.determine_model_dir(
         root_path=pathlib.Path(git_config.dir_path),
@@ -188,32 +245,45 @@ def copy_exported_files_into_git_repo() -> None:
         create_if_not_exist=True,
     )
 
-    model_dir = project_dir / t4c_config.project_name
+    with util_metrics.span("copy") as copy_span:
+        stats = util_archive.extract_zip_into_directory(
+            _find_project_archive(project_dir),
+            target_directory,
+            member_prefix=t4c_config.project_name,
+            indexed_hashes=util_git.get_indexed_blob_hashes(target_directory),
+            delete_removed_files=config.config.delete_removed_files,
+        )
+        copy_span.files = stats.written + stats.skipped + stats.deleted
+        copy_span.bytes = stats.bytes_written
 
-    shutil.copytree(
-        model_dir,
-        target_directory,
-        dirs_exist_ok=True,
+    log.info(
+        "Finished copying files (%d changed, %d unchanged, %d deleted)",
+        stats.written,
+        stats.skipped,
+        stats.deleted,
     )
 
-    log.info("Finished copying files...")
 
-
-def clean_and_create_t4c_project_dir() -> None:
-    """Remove all files in the t4c project directory or create it if it does not exist.
+def clean_and_create_directory(directory: pathlib.Path) -> None:
+    """Remove all files in the directory or create it if it does not exist.
 
     We can't simply remove the directory because it could be mounted as a volume.
     """
 
-    project_dir = pathlib.Path(config.config.t4c.project_dir_path)
-    if project_dir.exists():
-        for item in project_dir.iterdir():
+    if directory.exists():
+        for item in directory.iterdir():
             if item.is_dir():
                 shutil.rmtree(item)
             else:
                 item.unlink()
     else:
-        project_dir.mkdir(exist_ok=True)
+        directory.mkdir(exist_ok=True)
+
+
+def clean_and_create_t4c_project_dir() -> None:
+    clean_and_create_directory(
+        pathlib.Path(config.config.t4c.project_dir_path)
+    )
 
 
 class CommitHistoryEntry(t.TypedDict):
@@ -223,7 +293,7 @@ class CommitHistoryEntry(t.TypedDict):
 
 
 def parse_datetime_from_commit_history(date: str) -> datetime.datetime:
-    if util_capella.is_capella_7_x_x():
+    if util_capella.get_capella_version().has_iso_commit_history_dates:
         return datetime.datetime.fromisoformat(date)
 
     # Older versions of Capella use a format like "01/01/2020, 12:00"
@@ -233,24 +303,72 @@ def parse_datetime_from_commit_history(date: str) -> datetime.datetime:
 
 
 def get_activities_from_history() -> list[CommitHistoryEntry]:
+    """Read the activities from the exported commit history, newest first.
+
+    The history is parsed as stream, only the activities are kept.
+    """
+
     commit_history = next(
         pathlib.Path(config.config.t4c.project_dir_path).glob(
             "CommitHistory__*.json*"
         )
     )
 
-    with commit_history.open(encoding="utf-8") as file:
-        commit_history_json = json.load(file)
-
     return [
         {
             "description": activity.get("description") or "No commit message",
             "date": parse_datetime_from_commit_history(activity["date"]),
             "user": activity.get("user") or "Unknown",
         }
-        for activity in commit_history_json["activityMetadataExport"][
-            "activities"
-        ]
+        for activity in util_history.iter_json_array_items(
+            commit_history, "activities"
+        )
+    ]
+
+
+def get_activities_with_index(
+    last_backup_commit_datetime: datetime.datetime | None,
+) -> list[CommitHistoryEntry]:
+    """Return the pending activities using the activity index in the cache.
+
+    Only activities newer than the newest indexed activity are fetched
+    from the TeamForCapella server. Activities that are already backed
+    up are removed from the index. If the index doesn't cover all
+    activities since the last backup, e.g., after a reset of the Git
+    branch, it's rebuilt.
+    """
+
+    t4c_config = config.config.t4c
+    git_config = config.config.git
+    index = util_history.ActivityIndex(
+        pathlib.Path(config.config.cache_dir),
+        host=t4c_config.repo_host,
+        repository=t4c_config.repo_name,
+        project=t4c_config.project_name,
+        git_repo_url=git_config.repo_url,
+        git_branch=git_config.branch,
+    )
+    fetch_from = index.prepare_fetch(last_backup_commit_datetime)
+    log.info("Fetching T4C commit history since %s", fetch_from)
+    fetch_t4c_commit_history(last_backup_commit_datetime=fetch_from)
+
+    index.extend(
+        {
+            "description": activity["description"],
+            "date": activity["date"].isoformat(),
+            "user": activity["user"],
+        }
+        for activity in get_activities_from_history()
+    )
+    index.save()
+
+    return [
+        {
+            "description": activity["description"],
+            "date": datetime.datetime.fromisoformat(activity["date"]),
+            "user": activity["user"],
+        }
+        for activity in reversed(index.activities)
     ]
 
 
@@ -268,7 +386,6 @@ def grouped_git_commits(
 ) -> None:
     """Create one Git commit for all T4C activities since the last backup"""
     run_importer_script(last_backup_commit_datetime)
-    unzip_exported_files()
 
     activities = get_activities_from_history()
     if len(activities) == 0:
@@ -278,51 +395,148 @@ def grouped_git_commits(
     commit_information = yaml.dump(activities, sort_keys=False)
 
     copy_exported_files_into_git_repo()
-    util_git.git_commit_and_push(
-        git_config=config.config.git,
+    commit_pipeline = util_git.CommitPipeline(config.config.git)
+    commit_pipeline.commit(
         commit_message=f"[CDI] Backup\n\n{commit_information}",
         commit_datetime=activities[0]["date"],
+        last_activity=activities[0]["date"],
     )
+    commit_pipeline.push()
 
     log.info("Backup of model finished with grouped commit mapping")
 
 
+def _import_activity(
+    activity: CommitHistoryEntry,
+    output_folder: pathlib.Path,
+    workspaces: util_capella.WorkspacePool,
+) -> None:
+    """Import the state of the model at the time of the activity.
+
+    The function is executed in a worker thread.
+    """
+
+    with workspaces.acquire() as workspace:
+        output_folder.mkdir(parents=True, exist_ok=True)
+        run_importer_script(
+            checkout=activity["date"],
+            output_folder=str(output_folder),
+            workspace=workspace,
+        )
+
+
+def _map_activities_to_git_commits(
+    activities: list[tuple[int, CommitHistoryEntry]],
+    total: int,
+    workspaces: util_capella.WorkspacePool,
+    workers: int,
+    commit_pipeline: util_git.CommitPipeline,
+) -> None:
+    """Import the activities and create one Git commit per activity.
+
+    Only `workers` imports are in flight at the same time, which also
+    limits the disk space used by the output folders. The commits are
+    pushed by the commit pipeline and act as checkpoint for the next run.
+    """
+
+    project_dir = pathlib.Path(config.config.t4c.project_dir_path)
+    scheduled_activities = iter(activities)
+    imports: collections.deque[
+        tuple[CommitHistoryEntry, pathlib.Path, futures.Future[None]]
+    ] = collections.deque()
+
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+
+        def schedule_next_import() -> None:
+            scheduled = next(scheduled_activities, None)
+            if scheduled is None:
+                return
+
+            idx, activity = scheduled
+            log.info(
+                "Starting to export the following commit (%d/%d):"
+                "\nDate: %s"
+                "\nDescription: %s"
+                "\nUser: %s",
+                idx,
+                total,
+                activity["date"],
+                activity["description"],
+                activity["user"],
+            )
+            output_folder = project_dir / f"activity-{idx}"
+            imports.append(
+                (
+                    activity,
+                    output_folder,
+                    executor.submit(
+                        _import_activity, activity, output_folder, workspaces
+                    ),
+                )
+            )
+
+        for _ in range(workers):
+            schedule_next_import()
+
+        while imports:
+            activity, output_folder, future = imports.popleft()
+            schedule_next_import()
+
+            try:
+                future.result()
+            except ProjectNotFoundError:
+                log.warning(
+                    "Project not found in the repository for commit %s."
+                    " Continue with next commit.",
+                    activity["date"],
+                )
+                shutil.rmtree(output_folder, ignore_errors=True)
+                commit_pipeline.record_state(activity["date"])
+                continue
+
+            copy_exported_files_into_git_repo(output_folder)
+            shutil.rmtree(output_folder)
+
+            commit_pipeline.commit(
+                author=activity["user"],
+                commit_message=f"[CDI] {activity['description']}",
+                commit_datetime=activity["date"],
+                last_activity=activity["date"],
+            )
+
+
 def exact_git_commit_mapping(
     last_backup_commit_datetime: datetime.datetime | None = None,
 ) -> None:
-    """Create individual Git commits for each T4C activity since the last backup"""
+    """Create individual Git commits for each T4C activity since the last backup
 
-    fetch_t4c_commit_history(
-        last_backup_commit_datetime=last_backup_commit_datetime
-    )
-    activities = get_activities_from_history()
+    The activities are processed in batches of
+    `CDI_EXACT_MAPPING_BATCH_SIZE` activities. A single run processes
+    at most `CDI_EXACT_MAPPING_MAX_BATCHES` batches, the remaining
+    activities are picked up by the next runs.
 
-    if len(activities) == 0:
-        log.info("No new commits since last backup")
-        return
+    The imports of the activities run in a pool of
+    `CDI_EXACT_MAPPING_WORKERS` parallel Capella instances.
+    Each instance uses its own workspace and output folder.
+    The Git commits are created strictly in the order of the activities.
+    """
 
-    if len(activities) > 20:
-        log.warning(
-            "Too many commits for the exact commit mapping. Falling back to grouped commit mapping."
+    if config.config.cache_dir:
+        activities = get_activities_with_index(last_backup_commit_datetime)
+    else:
+        fetch_t4c_commit_history(
+            last_backup_commit_datetime=last_backup_commit_datetime
         )
-        grouped_git_commits(last_backup_commit_datetime)
+        activities = get_activities_from_history()
+
+    if len(activities) == 0:
+        log.info("No new commits since last backup")
         return
 
     log.info("Found %s commits since last backup", len(activities))
 
-    for idx, activity in enumerate(activities[::-1]):
-        log.info(
-            "Starting to export the following commit (%d/%d):"
-            "\nDate: %s"
-            "\nDescription: %s"
-            "\nUser: %s",
-            idx,
-            len(activities),
-            activity["date"],
-            activity["description"],
-            activity["user"],
-        )
-
+    pending_activities: list[CommitHistoryEntry] = []
+    for activity in activities[::-1]:
         if activity["date"] == last_backup_commit_datetime:
             log.info(
                 "Skipping commit '%s' from '%s', already committed",
@@ -330,32 +544,72 @@ def exact_git_commit_mapping(
                 activity["date"],
             )
             continue
+        pending_activities.append(activity)
 
-        clean_and_create_t4c_project_dir()
+    numbered_activities = list(enumerate(pending_activities, start=1))
+    batch_size = max(config.config.exact_mapping_batch_size, 1)
+    batches = [
+        numbered_activities[i : i + batch_size]
+        for i in range(0, len(numbered_activities), batch_size)
+    ]
+
+    max_batches = config.config.exact_mapping_max_batches
+    if 0 < max_batches < len(batches):
+        log.info(
+            "Processing %d of %d commits in this run."
+            " The remaining commits will be processed in the next runs.",
+            max_batches * batch_size,
+            len(pending_activities),
+        )
+        batches = batches[:max_batches]
+
+    workers = max(config.config.exact_mapping_workers, 1)
+    if workers > 1:
+        log.info("Importing activities with %d parallel workers", workers)
+    workspaces = util_capella.WorkspacePool(workers)
+
+    commit_pipeline = util_git.CommitPipeline(
+        config.config.git, push_interval=config.config.git.push_interval
+    )
+    for batch_number, batch in enumerate(batches, start=1):
+        log.info(
+            "Starting batch %d/%d with %d commits",
+            batch_number,
+            len(batches),
+            len(batch),
+        )
         try:
-            run_importer_script(checkout=activity["date"])
-        except ProjectNotFoundError:
-            log.warning(
-                "Project not found in the repository for commit %s."
-                " Continue with next commit.",
-                activity["date"],
+            _map_activities_to_git_commits(
+                batch,
+                len(pending_activities),
+                workspaces,
+                workers,
+                commit_pipeline,
             )
-            continue
-        unzip_exported_files()
-        copy_exported_files_into_git_repo()
-
-        util_git.git_commit_and_push(
-            git_config=config.config.git,
-            author=activity["user"],
-            commit_message=f"[CDI] {activity['description']}",
-            commit_datetime=activity["date"],
-        )
+        except BaseException:
+            # Push the completed activities, but keep the original error
+            try:
+                commit_pipeline.push()
+            except Exception:
+                log.exception("Failed to push the completed activities")
+            raise
+        commit_pipeline.push()
+        log.info("Checkpoint: Batch %d pushed", batch_number)
 
     log.info("Backup of model finished with exact commit mapping")
 
 
 @click.command()
 def backup() -> None:
+    succeeded = False
+    try:
+        _backup()
+        succeeded = True
+    finally:
+        util_metrics.write_report(succeeded)
+
+
+def _backup() -> None:
     git_config: config.GitConfig = config.config.git
     file_handler = config.config.file_handler
 
@@ -368,11 +622,14 @@ def backup() -> None:
 
     util_git.clone_git_repository_to_git_dir_path()
 
-    last_backup_commit_datetime = (
-        util_git.find_last_commit_timestamp_by_text_search(
-            git_config=git_config, grep_arg=r"\[CDI\]"
+    last_backup_commit_datetime = util_git.read_backup_state(git_config)
+    if not last_backup_commit_datetime:
+        log.info("No backup state found, searching the Git history instead")
+        last_backup_commit_datetime = (
+            util_git.find_last_commit_timestamp_by_text_search(
+                git_config=git_config, grep_arg=r"\[CDI\]"
+            )
         )
-    )
     if not last_backup_commit_datetime:
         # Legacy backup commits don't have the [CDI] tag
         last_backup_commit_datetime = (
@@ -386,21 +643,16 @@ def backup() -> None:
         last_backup_commit_datetime,
     )
 
-    if config.config.commit_mapping == config.CommitMapping.EXACT and (
-        not util_capella.is_capella_7_x_x()
-    ):
+    if config.config.commit_mapping == config.CommitMapping.EXACT:
+        if util_capella.get_capella_version().supports_exact_commit_mapping:
+            exact_git_commit_mapping(last_backup_commit_datetime)
+            return
+
         log.warning(
             "Exact commit mapping is only supported with Capella 7.x.x and later."
             " Fallback to grouped commits."
         )
 
-    if (
-        config.config.commit_mapping == config.CommitMapping.EXACT
-        and util_capella.is_capella_7_x_x()
-    ):
-        exact_git_commit_mapping(last_backup_commit_datetime)
-        return
-
     grouped_git_commits(last_backup_commit_datetime)
     return
 
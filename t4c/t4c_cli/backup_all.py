@@ -0,0 +1,201 @@
+# SPDX-FileCopyrightText: Copyright DB InfraGO AG and contributors
+# SPDX-License-Identifier: Apache-2.0
+
+"""Back up several TeamForCapella projects in one container.
+
+The projects are listed in a YAML manifest:
+
+```yaml
+projects:
+  - repository: repoCapella
+    project: test
+    git_repo_url: https://github.com/example/example.git
+    git_repo_branch: main
+    entrypoint: models/test
+    environment:
+      CDI_COMMIT_MAPPING: exact
+```
+
+Each project is backed up in a separate process with its own work
+directory, Capella workspace and copy of the global Git configuration.
+The Capella installation, the X server and the Git mirrors in
+`CDI_CACHE_DIR` are shared.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import pathlib
+import re
+import shutil
+import subprocess
+import sys
+import typing as t
+from concurrent import futures
+
+import click
+import yaml
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+log = logging.getLogger("Backup orchestrator")
+
+_MANIFEST_KEYS_TO_ENVIRONMENT = {
+    "repository": "T4C_REPO_NAME",
+    "project": "T4C_PROJECT_NAME",
+    "host": "T4C_REPO_HOST",
+    "port": "T4C_REPO_PORT",
+    "git_repo_url": "GIT_REPO_URL",
+    "git_repo_branch": "GIT_REPO_BRANCH",
+    "entrypoint": "ENTRYPOINT",
+}
+
+
+def load_manifest(manifest_path: pathlib.Path) -> list[dict[str, t.Any]]:
+    manifest = yaml.safe_load(manifest_path.read_text(encoding="utf-8"))
+    projects = (manifest or {}).get("projects") or []
+    for project in projects:
+        for key in ("repository", "project", "git_repo_url"):
+            if key not in project:
+                raise click.BadParameter(
+                    f"The key '{key}' is missing for the project {project}",
+                    param_hint="manifest",
+                )
+    return projects
+
+
+def _seed_git_config(work_dir: pathlib.Path) -> pathlib.Path:
+    """Copy the global Git configuration into the project work directory.
+
+    Each backup modifies its global Git configuration, e.g., it unsets
+    `core.hooksPath`. With a separate copy per project, the backups
+    don't depend on each other and don't compete for the lock file.
+    """
+
+    source = pathlib.Path(
+        os.getenv("GIT_CONFIG_GLOBAL") or pathlib.Path.home() / ".gitconfig"
+    )
+    git_config_path = work_dir / "gitconfig"
+    if source.is_file():
+        shutil.copyfile(source, git_config_path)
+    else:
+        git_config_path.write_text("", encoding="utf-8")
+    return git_config_path
+
+
+def _get_project_environment(
+    project: dict[str, t.Any], work_dir: pathlib.Path
+) -> dict[str, str]:
+    environment = dict(os.environ)
+    for key, environment_variable in _MANIFEST_KEYS_TO_ENVIRONMENT.items():
+        if key in project:
+            environment[environment_variable] = str(project[key])
+    environment |= {
+        key: str(value)
+        for key, value in (project.get("environment") or {}).items()
+    }
+    environment["CDI_WORK_DIR"] = str(work_dir)
+    environment["CDI_CAPELLA_WORKSPACE"] = str(work_dir / "workspace")
+    environment["GIT_CONFIG_GLOBAL"] = str(_seed_git_config(work_dir))
+    return environment
+
+
+def _get_project_label(project: dict[str, t.Any]) -> str:
+    return f"{project['repository']}/{project['project']}"
+
+
+def _get_work_dir(
+    work_root: pathlib.Path, idx: int, project: dict[str, t.Any]
+) -> pathlib.Path:
+    name = re.sub(
+        r"[^A-Za-z0-9_.-]", "_", f"{idx}-{_get_project_label(project)}"
+    )
+    return work_root / name
+
+
+def backup_project(project: dict[str, t.Any], work_dir: pathlib.Path) -> bool:
+    """Run the backup of a single project in a separate process.
+
+    The output of the process is prefixed with the project label.
+
+    Returns
+    -------
+    bool
+        True if the backup was successful.
+    """
+
+    label = _get_project_label(project)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    log.info("Starting backup of %s", label)
+
+    with subprocess.Popen(
+        [sys.executable, "-m", "t4c_cli.backup"],
+        env=_get_project_environment(project, work_dir),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    ) as popen:
+        assert popen.stdout
+        for line in popen.stdout:
+            print(f"[{label}] {line}", end="", flush=True)
+
+    if popen.returncode != 0:
+        log.error(
+            "Backup of %s failed with exit code %d", label, popen.returncode
+        )
+        return False
+
+    log.info("Backup of %s finished", label)
+    return True
+
+
+@click.command()
+@click.option(
+    "--manifest",
+    "manifest_path",
+    envvar="CDI_BACKUP_MANIFEST",
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path),
+    help="YAML file with the projects to back up.",
+)
+@click.option(
+    "--workers",
+    envvar="CDI_BACKUP_WORKERS",
+    default=2,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of projects that are backed up in parallel.",
+)
+def backup_all(manifest_path: pathlib.Path, workers: int) -> None:
+    projects = load_manifest(manifest_path)
+    work_root = pathlib.Path(os.getenv("CDI_WORK_DIR", "/tmp"), "projects")
+
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(
+            executor.map(
+                backup_project,
+                projects,
+                [
+                    _get_work_dir(work_root, idx, project)
+                    for idx, project in enumerate(projects)
+                ],
+            )
+        )
+
+    failed = [
+        _get_project_label(project)
+        for project, success in zip(projects, results, strict=True)
+        if not success
+    ]
+    log.info(
+        "Backed up %d of %d projects",
+        len(projects) - len(failed),
+        len(projects),
+    )
+    if failed:
+        log.error("Failed projects: %s", ", ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    backup_all()
@@ -3,31 +3,65 @@
 
 from __future__ import annotations
 
+import dataclasses
+import hashlib
+import json
 import logging
 import os
 import pathlib
-import re
-import shutil
+import subprocess
+import typing as t
 
 import click
 
 from .util import capella as util_capella
 from .util import config
+from .util import events as util_events
 from .util import git as util_git
+from .util import retry as util_retry
+from .util import staging as util_staging
 from .util import t4c as util_t4c
 
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 log = logging.getLogger("Exporter")
 
+_MAX_LOGGED_CHANGED_FILES = 50
+
 
 def _check_capella_version() -> None:
-    if util_capella.is_capella_5_x_x():
+    if not util_capella.get_capella_version().supports_export:
         raise RuntimeError("Operation is not supported for Capella 5.x.x")
 
 
-def _build_export_command(model_dir: pathlib.Path) -> list[str]:
-    t4c_config = config.config.t4c
+@dataclasses.dataclass
+class ExportTarget:
+    """TeamForCapella repository and project to export the model to."""
+
+    host: str
+    port: str
+    repository: str
+    project: str
+    credentials_file_path: str
+
+    @classmethod
+    def from_config(cls) -> ExportTarget:
+        t4c_config = config.config.t4c
+        return cls(
+            host=t4c_config.repo_host,
+            port=t4c_config.repo_port,
+            repository=t4c_config.repo_name,
+            project=t4c_config.project_name,
+            credentials_file_path=t4c_config.credentials_file_path,
+        )
 
+    @property
+    def label(self) -> str:
+        return f"{self.host}:{self.port}/{self.repository}/{self.project}"
+
+
+def _build_export_command(
+    model_dir: pathlib.Path, target: ExportTarget
+) -> list[str]:
     return [
         "-closeserverOnFailure",
         "false",
@@ -36,39 +70,137 @@ def _build_export_command(model_dir: pathlib.Path) -> list[str]:
         "-mergeDifferenceOnExistingProjects",
         "true",
         "-hostname",
-        t4c_config.repo_host,
+        target.host,
         "-port",
-        t4c_config.repo_port,
+        target.port,
         "-repoName",
-        t4c_config.repo_name,
+        target.repository,
         "-repositoryCredentials",
-        t4c_config.credentials_file_path,
+        target.credentials_file_path,
         "-sourceToExport",
         str(model_dir),
     ]
 
 
-def _validate_exporter_stdout(line: str) -> None:
-    if "No address associated with hostname" in line:
+def _handle_exporter_event(event: util_events.Event) -> None:
+    if event.type == util_events.EventType.UNKNOWN_HOST:
         raise RuntimeError("Unknown host")
-    if "No such user:" in line:
+    if event.type == util_events.EventType.UNKNOWN_USER:
         raise RuntimeError("Unknown user")
-    if re.search(r"[1-9][0-9]* projects? exports? failed", line):
+    if event.type == util_events.EventType.EXPORT_FAILED:
         raise RuntimeError("Export failed")
 
 
-def run_exporter_script(model_dir: pathlib.Path) -> None:
+def run_exporter_script(
+    model_dir: pathlib.Path,
+    target: ExportTarget | None = None,
+    workspace: str = util_capella.DEFAULT_CAPELLA_WORKSPACE,
+) -> None:
     log.debug("Export model to TeamForCapella server...")
 
-    util_capella.run_capella_command_and_handle_errors(
-        "com.thalesgroup.mde.melody.collab.exporter",
-        _build_export_command(model_dir),
-        _validate_exporter_stdout,
+    export_target = target or ExportTarget.from_config()
+    util_retry.call_with_retries(
+        lambda: util_capella.run_capella_command_and_handle_errors(
+            "com.thalesgroup.mde.melody.collab.exporter",
+            _build_export_command(model_dir, export_target),
+            _handle_exporter_event,
+            workspace=workspace,
+        ),
+        description=f"Export to {export_target.label}",
+        retry_on=(util_capella.TransientCapellaError,),
     )
 
 
-@click.command()
-def export() -> None:
+def _get_export_state_path(target: ExportTarget) -> pathlib.Path:
+    key = hashlib.sha256(target.label.encode()).hexdigest()
+    return pathlib.Path(config.config.cache_dir, "export", f"{key[:16]}.json")
+
+
+def _hash_file(path: pathlib.Path) -> str:
+    """Compute the Git blob hash of a file."""
+    digest = hashlib.sha1(f"blob {path.stat().st_size}\0".encode())
+    with path.open("rb") as file:
+        while chunk := file.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_model_file_hashes(model_dir: pathlib.Path) -> dict[str, str]:
+    """Return the content hashes of all files in the model directory.
+
+    If the model is part of a Git repository and the files match the
+    Git index, the hashes are taken from the index. Otherwise, e.g. for
+    a local checkout with uncommitted changes, the files are hashed.
+    Git metadata is never hashed.
+    """
+
+    if util_git.is_worktree_clean(model_dir) and (
+        hashes := util_git.get_indexed_blob_hashes(model_dir)
+    ):
+        return hashes
+
+    return {
+        path.relative_to(model_dir).as_posix(): _hash_file(path)
+        for path in model_dir.rglob("*")
+        if path.is_file() and ".git" not in path.relative_to(model_dir).parts
+    }
+
+
+def get_model_commit(directory: pathlib.Path) -> str | None:
+    result = subprocess.run(
+        ["git", "rev-parse", "HEAD"],
+        check=False,
+        capture_output=True,
+        text=True,
+        cwd=directory,
+    )
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def get_changed_files(
+    previous_hashes: dict[str, str], hashes: dict[str, str]
+) -> list[str]:
+    return sorted(
+        path
+        for path in previous_hashes.keys() | hashes.keys()
+        if previous_hashes.get(path) != hashes.get(path)
+    )
+
+
+def read_export_state(target: ExportTarget) -> dict[str, t.Any] | None:
+    """Read the state of the last successful export, if recorded."""
+
+    if not config.config.cache_dir:
+        return None
+
+    state_path = _get_export_state_path(target)
+    try:
+        return json.loads(state_path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        log.warning("Ignoring invalid export state in %s", state_path)
+        return None
+
+
+def write_export_state(
+    target: ExportTarget, commit: str | None, hashes: dict[str, str]
+) -> None:
+    if not config.config.cache_dir:
+        return
+
+    state_path = _get_export_state_path(target)
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = state_path.with_suffix(".tmp")
+    temporary_path.write_text(
+        json.dumps({"commit": commit, "files": hashes}), encoding="utf-8"
+    )
+    temporary_path.replace(state_path)
+
+
+def prepare_model_dir() -> pathlib.Path:
+    """Clone the Git repository, if configured, and return the model."""
+
     _check_capella_version()
 
     root_path = pathlib.Path(os.getenv("ROOT_PATH", "/tmp/data"))
@@ -84,11 +216,89 @@ def export() -> None:
     )
 
     util_t4c.check_dir_for_aird_files(model_dir)
+    return model_dir
+
+
+def has_changes_since_last_export(
+    target: ExportTarget, hashes: dict[str, str]
+) -> bool:
+    """Check if the model changed since the last export to the target.
+
+    The changed files are logged. Without recorded state, or if
+    `CDI_FORCE_EXPORT` is enabled, the model is always exported.
+    """
+
+    previous_state = read_export_state(target)
+    if previous_state is None or config.config.force_export:
+        return True
+
+    last_export = "the last export"
+    if previous_state["commit"]:
+        last_export += f" (commit {previous_state['commit']})"
+
+    changed_files = get_changed_files(previous_state["files"], hashes)
+    if not changed_files:
+        log.info(
+            "The model is unchanged since %s to %s, skipping the export",
+            last_export,
+            target.label,
+        )
+        return False
+
+    log.info(
+        "%d of %d files changed since %s to %s:\n%s",
+        len(changed_files),
+        len(hashes),
+        last_export,
+        target.label,
+        "\n".join(changed_files[:_MAX_LOGGED_CHANGED_FILES]),
+    )
+    return True
 
-    project_dir = pathlib.Path(f"/tmp/{config.config.t4c.project_name}")
-    shutil.copytree(model_dir, project_dir)
 
-    run_exporter_script(project_dir)
+def stage_model(
+    model_dir: pathlib.Path, staging_dir: pathlib.Path
+) -> pathlib.Path:
+    """Stage the model in a directory named after the project.
+
+    The exporter derives the project name from the directory name.
+    Hardlinks are only used for the temporary clone of the Git
+    repository, a local model directory must stay independent.
+    """
+
+    stats = util_staging.stage_directory(
+        model_dir,
+        staging_dir,
+        allow_hardlinks=config.config.file_handler == config.FileHandler.GIT,
+    )
+    if stats.copied:
+        log.info(
+            "Copied %d files to %s, links are not supported",
+            stats.copied,
+            staging_dir,
+        )
+    return staging_dir
+
+
+@click.command()
+def export() -> None:
+    model_dir = prepare_model_dir()
+    target = ExportTarget.from_config()
+
+    commit = get_model_commit(model_dir)
+    # Without a cache, there is no previous state to compare the hashes to
+    hashes = (
+        get_model_file_hashes(model_dir) if config.config.cache_dir else {}
+    )
+    if not has_changes_since_last_export(target, hashes):
+        return
+
+    project_dir = stage_model(
+        model_dir, pathlib.Path(config.WORK_DIR, "export", target.project)
+    )
+
+    run_exporter_script(project_dir, target)
+    write_export_state(target, commit, hashes)
 
     log.info("Export of model to TeamForCapella server finished")
 
@@ -0,0 +1,206 @@
+# SPDX-FileCopyrightText: Copyright DB InfraGO AG and contributors
+# SPDX-License-Identifier: Apache-2.0
+
+"""Export one model to several TeamForCapella repositories.
+
+The targets are listed in a YAML manifest:
+
+```yaml
+targets:
+  - host: t4c-team-a.example.com
+    repository: repoCapella
+    project: test
+  - host: t4c-team-b.example.com
+    port: 2037
+    repository: repoTeamB
+    project: test
+    username: team-b
+    password: secret
+```
+
+Keys that are not set fall back to the `T4C_*` environment variables.
+The Git repository is cloned once and the model is staged once per
+target with links. The exports run in a bounded number of parallel
+Capella sessions, each with its own workspace.
+"""
+
+from __future__ import annotations
+
+import enum
+import logging
+import os
+import pathlib
+import sys
+import typing as t
+from concurrent import futures
+
+import click
+import yaml
+
+from . import export as t4c_export
+from .util import capella as util_capella
+from .util import config
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+log = logging.getLogger("Export orchestrator")
+
+
+class ExportResult(enum.Enum):
+    EXPORTED = "exported"
+    UNCHANGED = "unchanged"
+    FAILED = "failed"
+
+
+def load_manifest(manifest_path: pathlib.Path) -> list[dict[str, t.Any]]:
+    manifest = yaml.safe_load(manifest_path.read_text(encoding="utf-8"))
+    targets = (manifest or {}).get("targets") or []
+    if not targets:
+        raise click.BadParameter(
+            "The manifest doesn't contain any targets",
+            param_hint="manifest",
+        )
+    return targets
+
+
+def _create_target(
+    entry: dict[str, t.Any], work_dir: pathlib.Path
+) -> t4c_export.ExportTarget:
+    """Create the target and write its credentials file."""
+
+    t4c_config = config.config.t4c
+    credentials_file_path = work_dir / "t4c_credentials"
+    credentials_file_path.parent.mkdir(parents=True, exist_ok=True)
+    credentials_file_path.write_text(
+        f"{entry.get('username', os.environ['T4C_USERNAME'])}"
+        f":{entry.get('password', os.environ['T4C_PASSWORD'])}",
+        encoding="utf-8",
+    )
+
+    return t4c_export.ExportTarget(
+        host=str(entry.get("host", t4c_config.repo_host)),
+        port=str(entry.get("port", t4c_config.repo_port)),
+        repository=str(entry.get("repository", t4c_config.repo_name)),
+        project=str(entry.get("project", t4c_config.project_name)),
+        credentials_file_path=str(credentials_file_path),
+    )
+
+
+def export_to_target(
+    target: t4c_export.ExportTarget,
+    project_dir: pathlib.Path,
+    commit: str | None,
+    hashes: dict[str, str],
+    workspaces: util_capella.WorkspacePool,
+) -> ExportResult:
+    """Export the staged model to a single target.
+
+    The function is executed in a worker thread.
+    """
+
+    try:
+        with workspaces.acquire() as workspace:
+            log.info("Starting export to %s", target.label)
+            t4c_export.run_exporter_script(project_dir, target, workspace)
+            t4c_export.write_export_state(target, commit, hashes)
+    except (Exception, SystemExit):
+        log.exception("Export to %s failed", target.label)
+        return ExportResult.FAILED
+
+    log.info("Export to %s finished", target.label)
+    return ExportResult.EXPORTED
+
+
+@click.command()
+@click.option(
+    "--manifest",
+    "manifest_path",
+    envvar="CDI_EXPORT_MANIFEST",
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path),
+    help="YAML file with the targets to export to.",
+)
+@click.option(
+    "--workers",
+    envvar="CDI_EXPORT_WORKERS",
+    default=2,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of exports that run in parallel.",
+)
+def export_all(manifest_path: pathlib.Path, workers: int) -> None:
+    entries = load_manifest(manifest_path)
+    work_root = pathlib.Path(config.WORK_DIR, "targets")
+
+    targets = [
+        _create_target(entry, work_root / str(idx))
+        for idx, entry in enumerate(entries)
+    ]
+    labels = [target.label for target in targets]
+    if duplicates := {label for label in labels if labels.count(label) > 1}:
+        raise click.BadParameter(
+            f"The targets {', '.join(sorted(duplicates))} are listed twice",
+            param_hint="manifest",
+        )
+
+    model_dir = t4c_export.prepare_model_dir()
+    commit = t4c_export.get_model_commit(model_dir)
+    hashes = (
+        t4c_export.get_model_file_hashes(model_dir)
+        if config.config.cache_dir
+        else {}
+    )
+
+    results: dict[str, ExportResult] = {}
+    pending_targets: list[tuple[t4c_export.ExportTarget, pathlib.Path]] = []
+    for idx, target in enumerate(targets):
+        if not t4c_export.has_changes_since_last_export(target, hashes):
+            results[target.label] = ExportResult.UNCHANGED
+            continue
+        pending_targets.append(
+            (
+                target,
+                t4c_export.stage_model(
+                    model_dir, work_root / str(idx) / target.project
+                ),
+            )
+        )
+
+    workspaces = util_capella.WorkspacePool(workers, suffix="export")
+
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        exports = {
+            target.label: executor.submit(
+                export_to_target,
+                target,
+                project_dir,
+                commit,
+                hashes,
+                workspaces,
+            )
+            for target, project_dir in pending_targets
+        }
+        results |= {
+            label: future.result() for label, future in exports.items()
+        }
+
+    for target in targets:
+        log.info("%s: %s", target.label, results[target.label].value)
+
+    failed = [
+        label
+        for label, result in results.items()
+        if result == ExportResult.FAILED
+    ]
+    log.info(
+        "Exported to %d of %d targets, %d unchanged",
+        list(results.values()).count(ExportResult.EXPORTED),
+        len(targets),
+        list(results.values()).count(ExportResult.UNCHANGED),
+    )
+    if failed:
+        log.error("Failed targets: %s", ", ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    export_all()
@@ -0,0 +1,185 @@
+# SPDX-FileCopyrightText: Copyright DB InfraGO AG and contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import dataclasses
+import hashlib
+import logging
+import pathlib
+import shutil
+import zipfile
+import zlib
+
+log = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclasses.dataclass
+class ExtractionStats:
+    written: int = 0
+    skipped: int = 0
+    deleted: int = 0
+    bytes_written: int = 0
+
+
+def _crc32_of_file(path: pathlib.Path) -> int:
+    crc = 0
+    with path.open("rb") as file:
+        while chunk := file.read(_CHUNK_SIZE):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def _git_blob_hash_of_member(
+    archive: zipfile.ZipFile, member: zipfile.ZipInfo, algorithm: str
+) -> str:
+    """Compute the Git object ID the member would have as blob."""
+    digest = hashlib.new(algorithm, f"blob {member.file_size}\0".encode())
+    with archive.open(member) as source:
+        while chunk := source.read(_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_unchanged(
+    archive: zipfile.ZipFile,
+    member: zipfile.ZipInfo,
+    path: pathlib.Path,
+    indexed_hash: str | None,
+) -> bool:
+    """Check if the file on disk has the same content as the member.
+
+    If the file is part of the Git index, the blob hash of the member is
+    compared against the index. Otherwise, or if the hashes differ (e.g.,
+    for Git LFS pointers), the size and CRC of the file are compared.
+    """
+    if not path.is_file():
+        return False
+    if path.stat().st_size != member.file_size:
+        return False
+    if indexed_hash is not None:
+        algorithm = "sha1" if len(indexed_hash) == 40 else "sha256"
+        if _git_blob_hash_of_member(archive, member, algorithm) == (
+            indexed_hash
+        ):
+            return True
+    return _crc32_of_file(path) == member.CRC
+
+
+def _delete_file_and_empty_parents(
+    path: pathlib.Path, root_dir: pathlib.Path
+) -> None:
+    path.unlink()
+    parent = path.parent
+    while parent != root_dir and not any(parent.iterdir()):
+        parent.rmdir()
+        parent = parent.parent
+
+
+def extract_zip_into_directory(
+    archive_path: pathlib.Path,
+    target_dir: pathlib.Path,
+    member_prefix: str = "",
+    indexed_hashes: dict[str, str] | None = None,
+    delete_removed_files: bool = False,
+) -> ExtractionStats:
+    """Synchronize the members of a zip archive into the target directory.
+
+    Only members below ``member_prefix`` are extracted, and the prefix is
+    removed from the target path. Existing files with the same content as
+    the archive member are not touched, so that their modification time
+    is preserved and Git doesn't have to hash them again.
+
+    Parameters
+    ----------
+    archive_path
+        Path to the zip archive.
+    target_dir
+        Directory to extract the archive into.
+    member_prefix
+        Only extract members below this directory in the archive.
+    indexed_hashes
+        Git blob hashes of the files in ``target_dir``, keyed by their
+        POSIX path relative to ``target_dir``.
+    delete_removed_files
+        Delete files listed in ``indexed_hashes`` that are not part of the
+        archive. Files starting with ``.git`` are always kept.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the archive doesn't contain any file below ``member_prefix``,
+        e.g., because the project folder in the archive has a different
+        name.
+    """
+
+    prefix = member_prefix.strip("/")
+    resolved_target_dir = target_dir.resolve()
+    indexed_hashes = indexed_hashes or {}
+    extracted_files: set[str] = set()
+    stats = ExtractionStats()
+
+    with zipfile.ZipFile(archive_path) as archive:
+        for member in archive.infolist():
+            name = pathlib.PurePosixPath(member.filename)
+            if prefix:
+                if not name.is_relative_to(prefix):
+                    continue
+                name = name.relative_to(prefix)
+
+            target_path = (resolved_target_dir / name).resolve()
+            if not target_path.is_relative_to(resolved_target_dir):
+                raise RuntimeError(
+                    f"Archive member '{member.filename}' points outside of {target_dir}"
+                )
+
+            if member.is_dir():
+                target_path.mkdir(parents=True, exist_ok=True)
+                continue
+
+            extracted_files.add(str(name))
+            if _is_unchanged(
+                archive, member, target_path, indexed_hashes.get(str(name))
+            ):
+                stats.skipped += 1
+                continue
+
+            target_path.parent.mkdir(parents=True, exist_ok=True)
+            with (
+                archive.open(member) as source,
+                target_path.open("wb") as target,
+            ):
+                shutil.copyfileobj(source, target, _CHUNK_SIZE)
+            stats.written += 1
+            stats.bytes_written += member.file_size
+
+    if not extracted_files:
+        location = f"below '{prefix}' " if prefix else ""
+        raise FileNotFoundError(
+            f"The archive {archive_path} doesn't contain any files {location}"
+            "to extract"
+        )
+
+    # Never delete files based on an empty archive, the index would be
+    # emptied completely in this case
+    if delete_removed_files and extracted_files:
+        for removed_file in indexed_hashes.keys() - extracted_files:
+            if pathlib.PurePosixPath(removed_file).name.startswith(".git"):
+                continue
+            path = resolved_target_dir / removed_file
+            if path.is_file() or path.is_symlink():
+                log.debug(
+                    "Deleting %s, it was removed from the project",
+                    removed_file,
+                )
+                _delete_file_and_empty_parents(path, resolved_target_dir)
+                stats.deleted += 1
+
+    log.debug(
+        "Extracted %s: %d files written, %d files unchanged, %d files deleted",
+        archive_path,
+        stats.written,
+        stats.skipped,
+        stats.deleted,
+    )
+    return stats
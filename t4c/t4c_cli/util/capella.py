@@ -1,116 +1,309 @@
 # SPDX-FileCopyrightText: Copyright DB InfraGO AG and contributors
 # SPDX-License-Identifier: Apache-2.0
 
+from __future__ import annotations
+
+import collections
+import collections.abc as cabc
+import contextlib
+import dataclasses
+import functools
 import logging
 import os
 import pathlib
+import queue
 import re
+import shlex
 import subprocess
-import sys
 import textwrap
+import threading
 import typing as t
 
 from . import config
+from . import events as util_events
 
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 log = logging.getLogger(__name__)
 
 DEFAULT_CAPELLA_COMMAND = [
-    "/opt/capella/capella",
+    *(
+        shlex.split(config.config.capella.command)
+        or [f"{config.config.capella.installation_dir}/capella"]
+    ),
     "--launcher.suppressErrors",
     "-nosplash",
     "-console",
     "-consoleLog",
-    "-data",
-    "workspace",
 ]
+DEFAULT_CAPELLA_WORKSPACE = config.config.capella.workspace
+DIAGNOSTIC_LINES = 1000
+
+
+class TransientCapellaError(RuntimeError):
+    """Error that might disappear if the command is repeated."""
+
+
+class T4CServerUnreachableError(TransientCapellaError):
+    """Exception if the TeamForCapella server can't be reached"""
+
+
+class T4CRepositoryNotFoundError(RuntimeError):
+    """Exception if the TeamForCapella repository doesn't exist"""
+
+
+class WorkspacePool:
+    """Pool of Capella workspaces for parallel Capella sessions.
+
+    Capella locks its workspace, so each session needs its own. The
+    workspaces are named after the default workspace, followed by the
+    ``suffix`` and the number of the worker. A single worker without
+    ``suffix`` uses the default workspace.
+    """
+
+    def __init__(self, workers: int, suffix: str = "") -> None:
+        self._workspaces: queue.SimpleQueue[str] = queue.SimpleQueue()
+        if workers == 1 and not suffix:
+            self._workspaces.put(DEFAULT_CAPELLA_WORKSPACE)
+            return
+
+        prefix = "-".join(filter(None, [DEFAULT_CAPELLA_WORKSPACE, suffix]))
+        for worker in range(workers):
+            self._workspaces.put(f"{prefix}-{worker}")
+
+    @contextlib.contextmanager
+    def acquire(self) -> cabc.Iterator[str]:
+        """Take a free workspace from the pool and return it afterwards.
+
+        If all workspaces are in use, wait until one is returned.
+        """
+
+        workspace = self._workspaces.get()
+        try:
+            yield workspace
+        finally:
+            self._workspaces.put(workspace)
+
+
+def _drain_stream(
+    stream: t.IO[str], buffer: collections.deque[str], prefix: str
+) -> None:
+    for line in stream:
+        buffer.append(line)
+        print(textwrap.indent(line, prefix), end="", flush=True)
 
 
 def run_capella_command_and_handle_errors(
     application: str,
     arguments: list[str],
-    stdout_line_validator: t.Callable[[str], None] | None = None,
+    event_handler: t.Callable[[util_events.Event], None] | None = None,
+    workspace: str = DEFAULT_CAPELLA_WORKSPACE,
 ) -> tuple[str, str]:
     """Run the provided Capella command.
 
-    The function validates the stdout of the command using the provided validator.
-    The validator is executed on each of stdout. An example validator looks like:
+    Each line of stdout is parsed once for known events. An unreachable
+    server or a missing repository raise an exception. All events are
+    passed to the ``event_handler``, which can validate the output.
+    An example handler looks like:
 
     ```py
-    def validate_line(line: str):
-        if "failure" in line:
+    def handle_event(event: util_events.Event):
+        if event.type == util_events.EventType.IMPORT_FAILED:
             raise RuntimeError()
     ```
+
+    Capella locks its workspace. If several commands run in parallel,
+    each of them needs a separate ``workspace``.
+
+    Both output streams are consumed while the command is running. Only
+    the last `DIAGNOSTIC_LINES` lines of each stream are kept and returned.
     """
 
     command = [
         *DEFAULT_CAPELLA_COMMAND,
+        "-data",
+        workspace,
         "-application",
         application,
         *arguments,
     ]
     log.info("Executing the following command: %s", " ".join(command))
 
-    stderr = ""
-    stdout = ""
+    stdout: collections.deque[str] = collections.deque(maxlen=DIAGNOSTIC_LINES)
+    stderr: collections.deque[str] = collections.deque(maxlen=DIAGNOSTIC_LINES)
     with subprocess.Popen(
         command,
-        cwd="/opt/capella",
+        cwd=config.config.capella.installation_dir,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         text=True,
     ) as popen:
         assert popen.stdout
-        for line in popen.stdout:
-            stdout += line
-
-            print(
-                textwrap.indent(
-                    line,
-                    "[STDOUT] ",
-                ),
-                end="",
-                flush=True,
-            )
-
-            if (
-                "Team for Capella server unreachable" in line
-                or "Name or service not known" in line
-            ):
-                raise RuntimeError("Team for Capella server unreachable")
+        assert popen.stderr
 
-            if "Repository not found" in line:
-                log.error(
-                    'Repository "%s" does not exist',
-                    config.config.t4c.repo_name,
-                )
-                sys.exit(1)
+        # Drain stderr in parallel, otherwise Capella blocks on a full pipe
+        stderr_thread = threading.Thread(
+            target=_drain_stream,
+            args=(popen.stderr, stderr, "[STDERR] "),
+            daemon=True,
+        )
+        stderr_thread.start()
 
-            if stdout_line_validator:
-                stdout_line_validator(line)
+        try:
+            for line in popen.stdout:
+                stdout.append(line)
 
-        if popen.stderr:
-            stderr = popen.stderr.read()
-            print("[STDERR] " + stderr, end="")
+                print(
+                    textwrap.indent(
+                        line,
+                        "[STDOUT] ",
+                    ),
+                    end="",
+                    flush=True,
+                )
+
+                for event in util_events.parse_line(line):
+                    if event.type == util_events.EventType.SERVER_UNREACHABLE:
+                        raise T4CServerUnreachableError(
+                            "Team for Capella server unreachable"
+                        )
+                    if (
+                        event.type
+                        == util_events.EventType.REPOSITORY_NOT_FOUND
+                    ):
+                        raise T4CRepositoryNotFoundError(
+                            "TeamForCapella repository not found"
+                        )
+                    if event_handler:
+                        event_handler(event)
+        except BaseException:
+            popen.kill()
+            raise
+        finally:
+            stderr_thread.join()
 
     if (return_code := popen.returncode) != 0:
         raise RuntimeError(
             f"Capella command failed with exit code {return_code}"
         )
 
-    return stdout, stderr
+    return "".join(stdout), "".join(stderr)
+
 
+_VERSION_PATTERN = re.compile(r"([0-9]+)\.([0-9]+)\.([0-9]+)")
+# Bundle that is part of every Capella installation, e.g.
+# org.polarsys.capella.rcp_7.0.0.202407091438.jar
+_VERSIONED_BUNDLE_PATTERN = re.compile(
+    r"org\.polarsys\.capella\.rcp_([0-9]+\.[0-9]+\.[0-9]+)"
+)
 
-def is_capella_7_x_x() -> bool:
-    return bool(re.match(r"7.[0-9]+.[0-9]+", config.config.capella.version))
 
+@dataclasses.dataclass(frozen=True)
+class CapellaVersion:
+    """Version of Capella and the features supported by it.
 
-def is_capella_5_x_x() -> bool:
-    return bool(re.match(r"5.[0-9]+.[0-9]+", config.config.capella.version))
+    An unknown version is represented as 0.0.0 and supports only the
+    features that are available in all versions.
+    """
+
+    major: int
+    minor: int
+    patch: int
+
+    @classmethod
+    def parse(cls, version: str) -> CapellaVersion | None:
+        if not (match := _VERSION_PATTERN.match(version)):
+            return None
+        return cls(*(int(part) for part in match.groups()))
+
+    def __str__(self) -> str:
+        return f"{self.major}.{self.minor}.{self.patch}"
+
+    @property
+    def supports_commit_history_only_import(self) -> bool:
+        return self.major == 7
+
+    @property
+    def supports_exact_commit_mapping(self) -> bool:
+        return self.major == 7
+
+    @property
+    def supports_export(self) -> bool:
+        return self.major != 5
+
+    @property
+    def has_iso_commit_history_dates(self) -> bool:
+        return self.major == 7
+
+    @property
+    def has_legacy_import_summary(self) -> bool:
+        """Capella 5.0 only reports the number of succeeded operations."""
+        return (self.major, self.minor) == (5, 0)
+
+    @property
+    def credentials_argument(self) -> str:
+        if self.major == 5:
+            return "-importerCredentials"
+        return "-repositoryCredentials"
+
+
+def _detect_installed_version(
+    installation_dir: pathlib.Path,
+) -> CapellaVersion | None:
+    """Read the version from the Capella installation.
+
+    The version is taken from the `.eclipseproduct` file, or from the
+    name of the Capella RCP bundle in the plugins directory.
+    """
+
+    try:
+        for line in (
+            (installation_dir / ".eclipseproduct")
+            .read_text(encoding="utf-8")
+            .splitlines()
+        ):
+            key, _, value = line.partition("=")
+            if key.strip() == "version" and (
+                version := CapellaVersion.parse(value.strip())
+            ):
+                return version
+    except OSError:
+        pass
+
+    plugins_dir = installation_dir / "plugins"
+    if plugins_dir.is_dir():
+        for plugin in plugins_dir.iterdir():
+            if match := _VERSIONED_BUNDLE_PATTERN.match(plugin.name):
+                return CapellaVersion.parse(match.group(1))
+
+    return None
+
+
+@functools.cache
+def get_capella_version() -> CapellaVersion:
+    """Return the version of Capella, computed once.
+
+    The version is read from `CAPELLA_VERSION`. If it's not set, it's
+    detected from the Capella installation.
+    """
+
+    if config.config.capella.version:
+        if version := CapellaVersion.parse(config.config.capella.version):
+            return version
+        log.warning(
+            "Can't parse CAPELLA_VERSION '%s'", config.config.capella.version
+        )
 
+    if version := _detect_installed_version(
+        pathlib.Path(config.config.capella.installation_dir)
+    ):
+        log.info("Detected Capella %s", version)
+        return version
 
-def is_capella_5_0_x() -> bool:
-    return bool(re.match(r"5.0.[0-9]+", config.config.capella.version))
+    log.warning(
+        "Can't determine the Capella version. Set CAPELLA_VERSION to"
+        " enable features that depend on the Capella version."
+    )
+    return CapellaVersion(0, 0, 0)
 
 
 def determine_model_dir(
@@ -5,13 +5,16 @@ import dataclasses
 import enum
 import os
 
+# Directory for temporary files, e.g. the Git clone and the T4C export
+WORK_DIR = os.getenv("CDI_WORK_DIR", "/tmp")
+
 
 def str_to_bool(value: str) -> bool:
     return value.lower() in ("true", "1")
 
 
 class GitConfig:
-    dir_path: str = "/tmp/git"
+    dir_path: str = f"{WORK_DIR}/git"
     repo_url: str = os.getenv("GIT_REPO_URL", "")
     branch: str = os.getenv("GIT_REPO_BRANCH", "")
     entrypoint: str | None = os.getenv("ENTRYPOINT") or os.getenv(
@@ -21,15 +24,20 @@ class GitConfig:
     username: str = os.getenv("GIT_USERNAME", "")
     password: str = os.getenv("GIT_PASSWORD", "")
     askpass: str = "/etc/git_askpass.py"
+    clone_depth: int = int(os.getenv("GIT_CLONE_DEPTH", "0"))
+    push_interval: int = int(os.getenv("GIT_PUSH_INTERVAL", "1"))
+    sparse_checkout: bool = str_to_bool(
+        os.getenv("GIT_SPARSE_CHECKOUT", "false")
+    )
 
 
 class T4CConfig:
-    project_dir_path: str = "/tmp/model"
+    project_dir_path: str = f"{WORK_DIR}/model"
     project_name: str = os.environ["T4C_PROJECT_NAME"]
     repo_host: str = os.environ["T4C_REPO_HOST"]
     repo_port: str = os.getenv("T4C_REPO_PORT", "2036")
     repo_name: str = os.environ["T4C_REPO_NAME"]
-    credentials_file_path: str = "/tmp/t4c_credentials"
+    credentials_file_path: str = f"{WORK_DIR}/t4c_credentials"
 
     def __init__(self) -> None:
         with open(self.credentials_file_path, "w", encoding="utf-8") as file:
@@ -40,6 +48,10 @@ class T4CConfig:
 
 class CapellaConfig:
     version: str = os.getenv("CAPELLA_VERSION", "")
+    workspace: str = os.getenv("CDI_CAPELLA_WORKSPACE", "workspace")
+    installation_dir: str = os.getenv("CDI_CAPELLA_DIR", "/opt/capella")
+    # Replaces the Capella executable, e.g. with a stub for benchmarks
+    command: str = os.getenv("CDI_CAPELLA_COMMAND", "")
 
 
 class FileHandler(enum.Enum):
@@ -56,6 +68,22 @@ class CommitMapping(str, enum.Enum):
 class GeneralConfig:
     file_handler = FileHandler(os.getenv("FILE_HANDLER", "GIT").upper())
     commit_mapping = CommitMapping(os.getenv("CDI_COMMIT_MAPPING", "grouped"))
+    cache_dir = os.getenv("CDI_CACHE_DIR", "")
+    delete_removed_files = str_to_bool(
+        os.getenv("CDI_DELETE_REMOVED_FILES", "false")
+    )
+    exact_mapping_workers = int(os.getenv("CDI_EXACT_MAPPING_WORKERS", "1"))
+    exact_mapping_batch_size = int(
+        os.getenv("CDI_EXACT_MAPPING_BATCH_SIZE", "20")
+    )
+    exact_mapping_max_batches = int(
+        os.getenv("CDI_EXACT_MAPPING_MAX_BATCHES", "1")
+    )
+    retry_attempts = int(os.getenv("CDI_RETRY_ATTEMPTS", "3"))
+    retry_backoff_seconds = float(os.getenv("CDI_RETRY_BACKOFF_SECONDS", "30"))
+    force_export = str_to_bool(os.getenv("CDI_FORCE_EXPORT", "false"))
+    metrics_report = os.getenv("CDI_METRICS_REPORT", "")
+    pushgateway_url = os.getenv("CDI_PUSHGATEWAY_URL", "")
 
     git: GitConfig = dataclasses.field(default_factory=GitConfig)
     t4c: T4CConfig = dataclasses.field(default_factory=T4CConfig)
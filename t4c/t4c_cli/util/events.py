@@ -0,0 +1,96 @@
+# SPDX-FileCopyrightText: Copyright DB InfraGO AG and contributors
+# SPDX-License-Identifier: Apache-2.0
+
+"""Known events in the output of the TeamForCapella applications.
+
+All signatures are combined into a single precompiled pattern, so that
+each line of output is scanned only once, independent of the number of
+signatures.
+"""
+
+import dataclasses
+import enum
+import re
+
+_COUNT = r"(?P<{}_COUNT>[1-9][0-9]*)"
+
+
+class EventType(enum.Enum):
+    SERVER_UNREACHABLE = enum.auto()
+    REPOSITORY_NOT_FOUND = enum.auto()
+    PROJECT_NOT_FOUND = enum.auto()
+    UNKNOWN_HOST = enum.auto()
+    UNKNOWN_USER = enum.auto()
+    LEGACY_SUCCEEDED = enum.auto()
+    IMPORT_SUCCEEDED = enum.auto()
+    IMPORT_FAILED = enum.auto()
+    ARCHIVING_SUCCEEDED = enum.auto()
+    ARCHIVING_FAILED = enum.auto()
+    EXPORT_FAILED = enum.auto()
+
+
+# Signatures of the events. `{count}` is replaced by a group, which
+# captures the number of succeeded or failed items.
+_SIGNATURES: dict[EventType, list[str]] = {
+    # Only messages which abort the application. Generic socket errors,
+    # e.g. "Connection reset", also appear in warnings of successful runs.
+    EventType.SERVER_UNREACHABLE: [
+        r"Team for Capella server unreachable",
+        r"Name or service not known",
+    ],
+    EventType.REPOSITORY_NOT_FOUND: [r"Repository not found"],
+    EventType.PROJECT_NOT_FOUND: [
+        r"project .+ not found on the repository .+\.",
+        r"No project found!",
+    ],
+    EventType.UNKNOWN_HOST: [r"No address associated with hostname"],
+    EventType.UNKNOWN_USER: [r"No such user:"],
+    EventType.LEGACY_SUCCEEDED: [r"!MESSAGE {count} Succeeded"],
+    EventType.IMPORT_SUCCEEDED: [r"{count} projects? imports? succeeded"],
+    EventType.IMPORT_FAILED: [r"{count} projects? imports? failed"],
+    EventType.ARCHIVING_SUCCEEDED: [r"{count} archivings? succeeded"],
+    EventType.ARCHIVING_FAILED: [r"{count} archivings? failed"],
+    EventType.EXPORT_FAILED: [r"{count} projects? exports? failed"],
+}
+
+
+def _compile_signatures() -> tuple[re.Pattern[str], dict[str, EventType]]:
+    alternatives = []
+    groups = {}
+    for event_type, signatures in _SIGNATURES.items():
+        for idx, signature in enumerate(signatures):
+            group = f"{event_type.name}_{idx}"
+            groups[group] = event_type
+            alternatives.append(
+                f"(?P<{group}>{signature.format(count=_COUNT.format(group))})"
+            )
+    return re.compile("|".join(alternatives)), groups
+
+
+_PATTERN, _GROUPS = _compile_signatures()
+
+
+@dataclasses.dataclass(frozen=True)
+class Event:
+    type: EventType
+    line: str
+    count: int | None = None
+
+
+def parse_line(line: str) -> list[Event]:
+    """Return all known events in a line of output."""
+
+    events = []
+    for match in _PATTERN.finditer(line):
+        # The outer group of the signature is always closed last
+        group = match.lastgroup
+        assert group is not None
+        count = match.groupdict().get(f"{group}_COUNT")
+        events.append(
+            Event(
+                type=_GROUPS[group],
+                line=line,
+                count=int(count) if count else None,
+            )
+        )
+    return events
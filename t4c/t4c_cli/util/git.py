@@ -2,6 +2,9 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import datetime
+import fcntl
+import hashlib
+import json
 import logging
 import os
 import pathlib
@@ -10,11 +13,20 @@ import subprocess
 
 from . import config
 from . import log as util_log
+from . import metrics as util_metrics
 
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 log = logging.getLogger("Git")
 
 
+def _get_git_credentials_env(git_config: config.GitConfig) -> dict[str, str]:
+    return {
+        "GIT_USERNAME": git_config.username,
+        "GIT_PASSWORD": git_config.password,
+        "GIT_ASKPASS": git_config.askpass,
+    }
+
+
 def clean_git_directory() -> None:
     git_dir = pathlib.Path(config.config.git.dir_path)
     if git_dir.exists():
@@ -38,6 +50,111 @@ def init_git() -> None:
     )
 
 
+def _remote_branch_exists(git_config: config.GitConfig, source: str) -> bool:
+    return (
+        subprocess.run(
+            [
+                "git",
+                "ls-remote",
+                "--exit-code",
+                "--heads",
+                source,
+                git_config.branch,
+            ],
+            check=False,
+            capture_output=True,
+            env=_get_git_credentials_env(git_config),
+        ).returncode
+        == 0
+    )
+
+
+def _get_sparse_checkout_dir(git_config: config.GitConfig) -> str | None:
+    """Return the directory for the sparse checkout, if enabled.
+
+    If the entrypoint points to a file (e.g. the `.aird` file), the
+    parent directory is used.
+    """
+    if not git_config.sparse_checkout or not git_config.entrypoint:
+        return None
+
+    entrypoint = pathlib.PurePosixPath(git_config.entrypoint.strip("/"))
+    if entrypoint.suffix:
+        entrypoint = entrypoint.parent
+    if str(entrypoint) == ".":
+        return None
+    return str(entrypoint)
+
+
+def _get_partial_clone_arguments(
+    git_config: config.GitConfig, source: str, local: bool = False
+) -> list[str]:
+    """Return the arguments to clone only the target branch, if enabled.
+
+    With `GIT_CLONE_DEPTH` or `GIT_SPARSE_CHECKOUT`, only the target branch
+    is cloned. If the branch doesn't exist yet, the default branch is
+    cloned instead. The depth is not applied to ``local`` clones, which
+    share the objects with the source anyway.
+    """
+    if not git_config.clone_depth and not git_config.sparse_checkout:
+        return []
+
+    arguments = ["--single-branch"]
+    if _remote_branch_exists(git_config, source):
+        arguments += ["--branch", git_config.branch]
+    if git_config.clone_depth and not local:
+        arguments += ["--depth", str(git_config.clone_depth)]
+    if _get_sparse_checkout_dir(git_config):
+        arguments += ["--sparse"]
+    return arguments
+
+
+def _update_git_mirror(git_config: config.GitConfig) -> pathlib.Path:
+    """Create or update a bare mirror of the repository in the cache.
+
+    The mirror is stored in `CDI_CACHE_DIR` and shared between runs.
+    A lock file prevents concurrent updates of the same mirror.
+    """
+
+    mirror_root = pathlib.Path(config.config.cache_dir, "git")
+    mirror_root.mkdir(parents=True, exist_ok=True)
+    mirror_name = hashlib.sha256(git_config.repo_url.encode()).hexdigest()
+    mirror_dir = mirror_root / f"{mirror_name[:16]}.git"
+    env = _get_git_credentials_env(git_config)
+
+    with (mirror_root / f"{mirror_dir.name}.lock").open("w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        if mirror_dir.exists():
+            log.debug("Updating Git mirror in %s...", mirror_dir)
+            subprocess.run(
+                ["git", "fetch", "--prune", "origin"],
+                check=True,
+                cwd=mirror_dir,
+                env=env,
+            )
+            return mirror_dir
+
+        log.debug("Creating Git mirror in %s...", mirror_dir)
+        incomplete_mirror_dir = mirror_dir.with_suffix(".tmp")
+        if incomplete_mirror_dir.exists():
+            shutil.rmtree(incomplete_mirror_dir)
+        subprocess.run(
+            [
+                "git",
+                "clone",
+                "--mirror",
+                git_config.repo_url,
+                str(incomplete_mirror_dir),
+            ],
+            check=True,
+            env=env,
+        )
+        incomplete_mirror_dir.rename(mirror_dir)
+
+    return mirror_dir
+
+
 def clone_git_repository_to_git_dir_path(
     raise_if_branch_not_exist: bool = False,
 ) -> pathlib.Path:
@@ -49,18 +166,33 @@ def clone_git_repository_to_git_dir_path(
     git_dir.mkdir(exist_ok=True)
 
     log.debug("Cloning git repository...")
-    env = {
-        "GIT_USERNAME": git_config.username,
-        "GIT_PASSWORD": git_config.password,
-        "GIT_ASKPASS": git_config.askpass,
-    }
+    env = _get_git_credentials_env(git_config)
+
+    if config.config.cache_dir:
+        # Clone from the cached mirror and share its objects
+        clone_source = str(_update_git_mirror(git_config))
+        clone_arguments = [
+            "--shared",
+            *_get_partial_clone_arguments(
+                git_config, clone_source, local=True
+            ),
+        ]
+    else:
+        clone_source = git_config.repo_url
+        clone_arguments = [
+            "--filter=blob:none",
+            *_get_partial_clone_arguments(git_config, clone_source),
+        ]
 
+    # The working copy is checked out after `origin` points to the real
+    # repository, the mirror doesn't contain the Git LFS objects
     subprocess.run(
         [
             "git",
             "clone",
-            "--filter=blob:none",
-            git_config.repo_url,
+            "--no-checkout",
+            *clone_arguments,
+            clone_source,
             git_config.dir_path,
         ],
         check=True,
@@ -68,6 +200,21 @@ def clone_git_repository_to_git_dir_path(
         env=env,
     )
 
+    if clone_source != git_config.repo_url:
+        subprocess.run(
+            ["git", "remote", "set-url", "origin", git_config.repo_url],
+            check=True,
+            cwd=git_dir,
+        )
+
+    if sparse_checkout_dir := _get_sparse_checkout_dir(git_config):
+        subprocess.run(
+            ["git", "sparse-checkout", "set", sparse_checkout_dir],
+            check=True,
+            cwd=git_dir,
+            env=env,
+        )
+
     try:
         subprocess.run(
             ["git", "switch", git_config.branch],
@@ -89,16 +236,33 @@ def clone_git_repository_to_git_dir_path(
                 f"Couldn't switch to branch {git_config.branch} in repository {git_config.repo_url}. Check the log message above."
             ) from err
 
+        # Check out the default branch instead, unless the repository
+        # is empty
+        head_exists = (
+            subprocess.run(
+                ["git", "rev-parse", "--verify", "--quiet", "HEAD"],
+                check=False,
+                cwd=git_dir,
+                capture_output=True,
+            ).returncode
+            == 0
+        )
+        if head_exists:
+            subprocess.run(
+                ["git", "checkout"],
+                check=True,
+                cwd=git_dir,
+                env={
+                    "SKIP_POST_CHECKOUT": "1",
+                }
+                | env,
+            )
+
     log.debug("Clone of git repository finished")
     return git_dir
 
 
-def git_commit_and_push(
-    git_config: config.GitConfig,
-    commit_message: str,
-    commit_datetime: datetime.datetime | None,
-    author: str = config.config.git.username,
-) -> None:
+def configure_git_identity(git_config: config.GitConfig) -> None:
     git_dir = pathlib.Path(git_config.dir_path)
 
     subprocess.run(
@@ -112,26 +276,61 @@ def git_commit_and_push(
         cwd=git_dir,
     )
 
-    subprocess.run(
-        ["git", "add", "."],
-        check=True,
-        cwd=git_dir,
-    )
 
-    diff_returncode = subprocess.run(
-        ["git", "diff", "--cached", "--quiet"],
-        check=False,
-        cwd=git_dir,
-    ).returncode
-
-    if diff_returncode == 1:
-        git_commit_env = None
-        if commit_datetime is not None:
-            git_commit_env = {
-                "GIT_AUTHOR_DATE": commit_datetime.isoformat(),
-                "GIT_COMITTER_DATE": commit_datetime.isoformat(),
-            }
+def git_commit(
+    git_config: config.GitConfig,
+    commit_message: str,
+    commit_datetime: datetime.datetime | None,
+    author: str = config.config.git.username,
+) -> bool:
+    """Commit all changes in the Git directory locally.
 
+    Returns
+    -------
+    bool
+        True if a commit was created, False if there were no changes.
+    """
+
+    git_dir = pathlib.Path(git_config.dir_path)
+
+    with util_metrics.span("git_add") as add_span:
+        subprocess.run(
+            ["git", "add", "."],
+            check=True,
+            cwd=git_dir,
+        )
+
+        changed_files = [
+            name
+            for name in subprocess.run(
+                ["git", "diff", "--cached", "--name-only", "-z"],
+                check=True,
+                capture_output=True,
+                cwd=git_dir,
+            ).stdout.split(b"\0")
+            if name
+        ]
+        add_span.files = len(changed_files)
+        add_span.bytes = sum(
+            path.stat().st_size
+            for name in changed_files
+            if (path := git_dir / os.fsdecode(name)).is_file()
+        )
+
+    if not changed_files:
+        log.warning("No changes, will not commit.")
+        return False
+
+    git_commit_env = None
+    if commit_datetime is not None:
+        git_commit_env = {
+            "GIT_AUTHOR_DATE": commit_datetime.isoformat(),
+            "GIT_COMITTER_DATE": commit_datetime.isoformat(),
+        }
+
+    with util_metrics.span("git_commit") as commit_span:
+        commit_span.files = add_span.files
+        commit_span.bytes = add_span.bytes
         subprocess.run(
             [
                 "git",
@@ -146,24 +345,213 @@ def git_commit_and_push(
             cwd=git_dir,
             env=git_commit_env,
         )
+    return True
 
-        subprocess.run(
-            [
-                "git",
-                "push",
-                "origin",
-                f"HEAD:{git_config.branch}",
-            ],
+
+def _get_remote_branch_commit(git_config: config.GitConfig) -> str:
+    """Return the commit of the branch on the remote at clone time.
+
+    An empty string is returned if the branch doesn't exist on the remote.
+    """
+    result = subprocess.run(
+        [
+            "git",
+            "rev-parse",
+            "--verify",
+            "--quiet",
+            f"refs/remotes/origin/{git_config.branch}",
+        ],
+        check=False,
+        capture_output=True,
+        text=True,
+        cwd=pathlib.Path(git_config.dir_path),
+    )
+    return result.stdout.strip()
+
+
+class CommitPipeline:
+    """Create Git commits locally and push them in batches.
+
+    The commits are pushed after every `push_interval` commits and when
+    `push` is called. A `push_interval` of 0 only pushes on `push`.
+    Each push is protected by a lease: it fails if somebody else
+    pushed to the branch in the meantime. The backup state is pushed
+    atomically together with the branch.
+    """
+
+    def __init__(
+        self, git_config: config.GitConfig, push_interval: int = 1
+    ) -> None:
+        self.git_config = git_config
+        self.push_interval = push_interval
+        self.unpushed_commits = 0
+        self._unpushed_state = False
+        self._expected_remote_commit = _get_remote_branch_commit(git_config)
+        configure_git_identity(git_config)
+
+    def commit(
+        self,
+        commit_message: str,
+        commit_datetime: datetime.datetime | None,
+        author: str = config.config.git.username,
+        last_activity: datetime.datetime | None = None,
+    ) -> bool:
+        """Commit all changes and push if the push interval is reached.
+
+        If `last_activity` is given, the backup state is recorded before
+        the push, so that the commit and its state are pushed together.
+
+        Returns
+        -------
+        bool
+            True if a commit was created, False if there were no changes.
+        """
+
+        committed = git_commit(
+            self.git_config, commit_message, commit_datetime, author
+        )
+        if last_activity is not None:
+            self.record_state(last_activity)
+        if not committed:
+            return False
+
+        self.unpushed_commits += 1
+        if 0 < self.push_interval <= self.unpushed_commits:
+            self.push()
+        return True
+
+    def record_state(self, last_activity: datetime.datetime) -> None:
+        """Record the backup state, it's pushed with the next push."""
+        record_backup_state(self.git_config, last_activity)
+        self._unpushed_state = True
+
+    def _get_unpushed_size(self) -> int:
+        """Estimate the size of the objects that are not pushed yet.
+
+        The size is the on-disk size of the objects, which is
+        approximately the size of the pack sent to the remote.
+        """
+        revisions = ["HEAD"]
+        if self._expected_remote_commit:
+            revisions.append(f"^{self._expected_remote_commit}")
+        result = subprocess.run(
+            ["git", "rev-list", "--objects", "--disk-usage", *revisions],
+            check=False,
+            capture_output=True,
+            text=True,
+            cwd=pathlib.Path(self.git_config.dir_path),
+        )
+        if result.returncode != 0:
+            return 0
+        return int(result.stdout.strip() or 0)
+
+    def push(self) -> None:
+        """Push all local commits and the backup state in one request."""
+
+        if not self.unpushed_commits and not self._unpushed_state:
+            return
+
+        git_dir = pathlib.Path(self.git_config.dir_path)
+        branch_ref = f"refs/heads/{self.git_config.branch}"
+        refspecs = []
+        if self.unpushed_commits:
+            refspecs.append(f"HEAD:{branch_ref}")
+        if self._unpushed_state:
+            state_ref = _get_backup_state_ref(self.git_config)
+            if (
+                subprocess.run(
+                    ["git", "rev-parse", "--verify", "--quiet", state_ref],
+                    check=False,
+                    capture_output=True,
+                    cwd=git_dir,
+                ).returncode
+                == 0
+            ):
+                refspecs.append(f"{state_ref}:{state_ref}")
+
+        if not refspecs:
+            return
+
+        if self.unpushed_commits:
+            log.info("Pushing %d commits...", self.unpushed_commits)
+        else:
+            log.info("Pushing the backup state...")
+        with util_metrics.span("git_push") as push_span:
+            if util_metrics.is_enabled():
+                push_span.bytes = self._get_unpushed_size()
+            subprocess.run(
+                [
+                    "git",
+                    "push",
+                    "--atomic",
+                    f"--force-with-lease={branch_ref}:{self._expected_remote_commit}",
+                    "origin",
+                    *refspecs,
+                ],
+                check=True,
+                cwd=git_dir,
+                env=_get_git_credentials_env(self.git_config),
+            )
+
+        self._expected_remote_commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
             check=True,
+            capture_output=True,
+            text=True,
             cwd=git_dir,
-            env={
-                "GIT_USERNAME": git_config.username,
-                "GIT_PASSWORD": git_config.password,
-                "GIT_ASKPASS": git_config.askpass,
-            },
-        )
-    else:
-        log.warning("No changes, will not commit.")
+        ).stdout.strip()
+        self.unpushed_commits = 0
+        self._unpushed_state = False
+
+
+def is_worktree_clean(directory: pathlib.Path) -> bool:
+    """Check if the files below a directory match the Git index.
+
+    Modified, untracked and ignored files count as changes. If the
+    directory is not part of a Git repository, False is returned.
+    """
+
+    result = subprocess.run(
+        [
+            "git",
+            "status",
+            "--porcelain",
+            "--ignored",
+            "--untracked-files=all",
+            "--",
+            ".",
+        ],
+        check=False,
+        capture_output=True,
+        cwd=directory,
+    )
+    return result.returncode == 0 and not result.stdout.strip()
+
+
+def get_indexed_blob_hashes(directory: pathlib.Path) -> dict[str, str]:
+    """Return the blob hashes of all files in the Git index below a directory.
+
+    The keys are the POSIX paths relative to the directory. If the
+    directory is not part of a Git repository, an empty dict is returned.
+    """
+
+    result = subprocess.run(
+        ["git", "ls-files", "--stage", "-z", "--", "."],
+        check=False,
+        capture_output=True,
+        cwd=directory,
+    )
+    if result.returncode != 0:
+        return {}
+
+    hashes: dict[str, str] = {}
+    for entry in result.stdout.decode("utf-8").split("\0"):
+        if not entry:
+            continue
+        info, path = entry.split("\t", 1)
+        _, blob_hash, _ = info.split(" ")
+        hashes[path] = blob_hash
+    return hashes
 
 
 def find_last_commit_timestamp_by_text_search(
@@ -204,3 +592,104 @@ def find_last_commit_timestamp_by_text_search(
             int(result.stdout.strip()), tz=datetime.UTC
         )
     return None
+
+
+def _get_backup_state_ref(git_config: config.GitConfig) -> str:
+    return f"refs/notes/cdi/{git_config.branch}"
+
+
+def read_backup_state(
+    git_config: config.GitConfig,
+) -> datetime.datetime | None:
+    """Read the date of the last imported T4C activity.
+
+    The backup state is stored as Git note on the last backup commit in
+    the notes ref `refs/notes/cdi/<branch>`. Reading it doesn't require a
+    search through the Git history.
+
+    Returns
+    -------
+    datetime.datetime or None
+        The date of the last imported activity, or None if there is no
+        state for the configured project on the current HEAD.
+    """
+
+    git_dir = pathlib.Path(git_config.dir_path)
+    state_ref = _get_backup_state_ref(git_config)
+
+    fetch_result = subprocess.run(
+        ["git", "fetch", "origin", f"+{state_ref}:{state_ref}"],
+        check=False,
+        capture_output=True,
+        text=True,
+        cwd=git_dir,
+        env=_get_git_credentials_env(git_config),
+    )
+    if fetch_result.returncode != 0:
+        log.debug("No backup state found in %s", state_ref)
+        return None
+
+    show_result = subprocess.run(
+        ["git", "notes", f"--ref={state_ref}", "show", "HEAD"],
+        check=False,
+        capture_output=True,
+        text=True,
+        cwd=git_dir,
+    )
+    if show_result.returncode != 0:
+        log.debug("No backup state attached to HEAD")
+        return None
+
+    try:
+        state = json.loads(show_result.stdout)
+        t4c_config = config.config.t4c
+        if (
+            state["repository"] != t4c_config.repo_name
+            or state["project"] != t4c_config.project_name
+        ):
+            log.debug("Backup state on HEAD belongs to another project")
+            return None
+        return datetime.datetime.fromisoformat(state["last_activity"])
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+        log.warning("Ignoring invalid backup state: %s", show_result.stdout)
+        return None
+
+
+def record_backup_state(
+    git_config: config.GitConfig, last_activity: datetime.datetime
+) -> None:
+    """Attach the date of the last imported T4C activity to HEAD.
+
+    The state is only recorded locally, it's pushed by the `CommitPipeline`.
+    If the repository doesn't have any commit yet, no state is recorded.
+    """
+
+    t4c_config = config.config.t4c
+    state = {
+        "repository": t4c_config.repo_name,
+        "project": t4c_config.project_name,
+        "last_activity": last_activity.isoformat(),
+    }
+
+    result = subprocess.run(
+        [
+            "git",
+            "-c",
+            f"user.name={git_config.username}",
+            "-c",
+            f"user.email={git_config.email}",
+            "notes",
+            f"--ref={_get_backup_state_ref(git_config)}",
+            "add",
+            "--force",
+            "--message",
+            json.dumps(state),
+            "HEAD",
+        ],
+        check=False,
+        cwd=pathlib.Path(git_config.dir_path),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        log.debug("Couldn't record the backup state: %s", result.stderr)
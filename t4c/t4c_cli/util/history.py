@@ -0,0 +1,204 @@
+# SPDX-FileCopyrightText: Copyright DB InfraGO AG and contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import collections.abc as cabc
+import datetime
+import hashlib
+import json
+import logging
+import pathlib
+import re
+import typing as t
+
+log = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array_items(
+    path: pathlib.Path, key: str
+) -> cabc.Iterator[t.Any]:
+    """Yield the items of the first JSON array with the given key.
+
+    The file is read in chunks, so that only a single item has to be
+    kept in memory at once. If the key doesn't exist, nothing is yielded.
+    """
+
+    decoder = json.JSONDecoder()
+    array_start = re.compile(rf'"{re.escape(key)}"\s*:\s*\[')
+
+    with path.open(encoding="utf-8") as file:
+
+        def read_more(buffer: str) -> str:
+            chunk = file.read(_CHUNK_SIZE)
+            if not chunk:
+                raise ValueError(f"Unexpected end of JSON file {path}")
+            return buffer + chunk
+
+        buffer = ""
+        while not (match := array_start.search(buffer)):
+            chunk = file.read(_CHUNK_SIZE)
+            if not chunk:
+                return
+            # Keep the tail in case the key is split between two chunks
+            buffer = buffer[-(len(key) + 64) :] + chunk
+        buffer = buffer[match.end() :]
+
+        while True:
+            buffer = buffer.lstrip()
+            if not buffer:
+                buffer = read_more(buffer)
+                continue
+            if buffer[0] == "]":
+                return
+            if buffer[0] == ",":
+                buffer = buffer[1:]
+                continue
+
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                buffer = read_more(buffer)
+                continue
+
+            yield item
+            buffer = buffer[end:]
+
+
+class ActivityIndex:
+    """Persistent index of the T4C activities of a project.
+
+    The index is stored as JSON file in the cache directory. Each
+    activity is identified by its date and description. The index is
+    extended by each run, so that only the newest activities have to be
+    fetched from the TeamForCapella server.
+
+    The index contains all activities after its start date. Backed up
+    activities are discarded from the index. Therefore, each backup
+    target (Git repository and branch) has its own index, even if
+    several targets back up the same project.
+    """
+
+    def __init__(
+        self,
+        cache_dir: pathlib.Path,
+        host: str,
+        repository: str,
+        project: str,
+        git_repo_url: str,
+        git_branch: str,
+    ) -> None:
+        key = hashlib.sha256(
+            json.dumps(
+                [host, repository, project, git_repo_url, git_branch]
+            ).encode()
+        ).hexdigest()
+        self.path = cache_dir / "activities" / f"{key[:16]}.json"
+        self.exists = self.path.exists()
+        self.start: datetime.datetime | None = None
+        self.activities: list[dict[str, t.Any]] = []
+
+        if self.exists:
+            index = json.loads(self.path.read_text(encoding="utf-8"))
+            if index["start"] is not None:
+                self.start = datetime.datetime.fromisoformat(index["start"])
+            self.activities = index["activities"]
+            log.debug(
+                "Loaded %d activities since %s from %s",
+                len(self.activities),
+                self.start,
+                self.path,
+            )
+
+    @staticmethod
+    def _key(activity: dict[str, t.Any]) -> tuple[str, str]:
+        return activity["date"], activity["description"]
+
+    def latest_date(self) -> datetime.datetime | None:
+        if not self.activities:
+            return None
+        return datetime.datetime.fromisoformat(self.activities[-1]["date"])
+
+    def covers(self, date: datetime.datetime | None) -> bool:
+        """Check if the index contains all activities after the date."""
+        if not self.exists:
+            return False
+        if self.start is None:
+            return True
+        return date is not None and date >= self.start
+
+    def prepare_fetch(
+        self, last_backup: datetime.datetime | None
+    ) -> datetime.datetime | None:
+        """Align the index with the last backup and return the fetch start.
+
+        Activities up to the last backup are discarded. If the index
+        doesn't cover all activities after the last backup, e.g.,
+        because the Git branch was reset, the index is cleared and the
+        whole window since the last backup has to be fetched.
+        """
+
+        if not self.covers(last_backup):
+            if self.activities:
+                log.info(
+                    "The activity index starts at %s, after the last backup"
+                    " on %s. Rebuilding the index.",
+                    self.start,
+                    last_backup,
+                )
+            self.start = last_backup
+            self.activities = []
+            self.exists = True
+            return last_backup
+
+        if last_backup is not None:
+            self.discard_until(last_backup)
+        return max(
+            (
+                date
+                for date in (last_backup, self.latest_date())
+                if date is not None
+            ),
+            default=None,
+        )
+
+    def extend(self, activities: cabc.Iterable[dict[str, t.Any]]) -> None:
+        """Add new activities and keep the index sorted by date.
+
+        The dates have to be in ISO format.
+        """
+
+        known_keys = {self._key(activity) for activity in self.activities}
+        for activity in activities:
+            if self._key(activity) not in known_keys:
+                known_keys.add(self._key(activity))
+                self.activities.append(activity)
+        self.activities.sort(
+            key=lambda activity: datetime.datetime.fromisoformat(
+                activity["date"]
+            )
+        )
+
+    def discard_until(self, date: datetime.datetime) -> None:
+        """Remove all activities up to the given date, e.g. after a backup."""
+        self.activities = [
+            activity
+            for activity in self.activities
+            if datetime.datetime.fromisoformat(activity["date"]) > date
+        ]
+        if self.start is None or date > self.start:
+            self.start = date
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.path.with_suffix(".tmp")
+        temporary_path.write_text(
+            json.dumps(
+                {
+                    "start": self.start.isoformat() if self.start else None,
+                    "activities": self.activities,
+                }
+            ),
+            encoding="utf-8",
+        )
+        temporary_path.replace(self.path)
@@ -0,0 +1,224 @@
+# SPDX-FileCopyrightText: Copyright DB InfraGO AG and contributors
+# SPDX-License-Identifier: Apache-2.0
+
+"""Timing and throughput of the individual phases of a run.
+
+Each phase (e.g. the import or the Git push) is recorded as span with
+its duration and the number of processed files and bytes. At the end
+of a run, the spans are written as JSON report to `CDI_METRICS_REPORT`
+and pushed to the Prometheus Pushgateway at `CDI_PUSHGATEWAY_URL`.
+"""
+
+import base64
+import collections.abc as cabc
+import contextlib
+import dataclasses
+import datetime
+import http.client
+import json
+import logging
+import pathlib
+import threading
+import time
+import typing as t
+import urllib.request
+
+from . import config
+
+log = logging.getLogger(__name__)
+
+_PUSHGATEWAY_JOB = "cdi_backup"
+_PUSHGATEWAY_TIMEOUT = 10
+
+
+@dataclasses.dataclass
+class Span:
+    phase: str
+    started: datetime.datetime
+    duration_seconds: float = 0.0
+    files: int = 0
+    bytes: int = 0
+    failed: bool = False
+
+
+_spans: list[Span] = []
+_spans_lock = threading.Lock()
+_run_started = datetime.datetime.now(datetime.UTC)
+
+
+def is_enabled() -> bool:
+    """Check if the metrics are reported anywhere.
+
+    Use it to skip expensive measurements if nobody consumes them.
+    """
+    return bool(config.config.metrics_report or config.config.pushgateway_url)
+
+
+@contextlib.contextmanager
+def span(phase: str) -> cabc.Iterator[Span]:
+    """Measure the duration of a phase.
+
+    The caller can set the number of processed files and bytes on the
+    yielded span. The span is also recorded if the phase fails.
+    """
+
+    current_span = Span(
+        phase=phase, started=datetime.datetime.now(datetime.UTC)
+    )
+    start = time.perf_counter()
+    try:
+        yield current_span
+    except BaseException:
+        current_span.failed = True
+        raise
+    finally:
+        current_span.duration_seconds = time.perf_counter() - start
+        with _spans_lock:
+            _spans.append(current_span)
+        log.debug(
+            "Phase %s took %.2fs (%d files, %d bytes)",
+            phase,
+            current_span.duration_seconds,
+            current_span.files,
+            current_span.bytes,
+        )
+
+
+def get_directory_size(directory: pathlib.Path) -> tuple[int, int]:
+    """Return the number of files and the total size of a directory."""
+
+    files = 0
+    size = 0
+    for path in directory.rglob("*"):
+        if path.is_file():
+            files += 1
+            size += path.stat().st_size
+    return files, size
+
+
+def _summarize_phases() -> dict[str, dict[str, t.Any]]:
+    phases: dict[str, dict[str, t.Any]] = {}
+    for recorded_span in _spans:
+        phase = phases.setdefault(
+            recorded_span.phase,
+            {
+                "count": 0,
+                "failed": 0,
+                "duration_seconds": 0.0,
+                "files": 0,
+                "bytes": 0,
+            },
+        )
+        phase["count"] += 1
+        phase["failed"] += int(recorded_span.failed)
+        phase["duration_seconds"] += recorded_span.duration_seconds
+        phase["files"] += recorded_span.files
+        phase["bytes"] += recorded_span.bytes
+
+    for phase in phases.values():
+        phase["bytes_per_second"] = (
+            phase["bytes"] / phase["duration_seconds"]
+            if phase["duration_seconds"]
+            else 0.0
+        )
+    return phases
+
+
+def build_report(succeeded: bool) -> dict[str, t.Any]:
+    with _spans_lock:
+        return {
+            "repository": config.config.t4c.repo_name,
+            "project": config.config.t4c.project_name,
+            "commit_mapping": config.config.commit_mapping.value,
+            "started": _run_started.isoformat(),
+            "duration_seconds": (
+                datetime.datetime.now(datetime.UTC) - _run_started
+            ).total_seconds(),
+            "succeeded": succeeded,
+            "phases": _summarize_phases(),
+            "spans": [
+                dataclasses.asdict(recorded_span)
+                | {"started": recorded_span.started.isoformat()}
+                for recorded_span in _spans
+            ],
+        }
+
+
+def _format_prometheus_metrics(report: dict[str, t.Any]) -> str:
+    """Format the report in the Prometheus text exposition format."""
+
+    lines = [
+        "# TYPE cdi_backup_duration_seconds gauge",
+        f"cdi_backup_duration_seconds {report['duration_seconds']}",
+        "# TYPE cdi_backup_succeeded gauge",
+        f"cdi_backup_succeeded {int(report['succeeded'])}",
+        "# TYPE cdi_backup_last_run_timestamp_seconds gauge",
+        f"cdi_backup_last_run_timestamp_seconds {time.time()}",
+    ]
+    for metric, key in (
+        ("cdi_backup_phase_duration_seconds", "duration_seconds"),
+        ("cdi_backup_phase_runs", "count"),
+        ("cdi_backup_phase_failures", "failed"),
+        ("cdi_backup_phase_files", "files"),
+        ("cdi_backup_phase_bytes", "bytes"),
+    ):
+        lines.append(f"# TYPE {metric} gauge")
+        lines.extend(
+            f'{metric}{{phase="{phase}"}} {values[key]}'
+            for phase, values in report["phases"].items()
+        )
+    return "\n".join(lines) + "\n"
+
+
+def _encode_grouping_label(name: str, value: str) -> str:
+    encoded = base64.urlsafe_b64encode(value.encode()).decode()
+    return f"{name}@base64/{encoded or '='}"
+
+
+def push_to_gateway(report: dict[str, t.Any], url: str) -> None:
+    """Replace the metrics of this project in the Pushgateway."""
+
+    grouping_key = "/".join(
+        (
+            _encode_grouping_label("repository", report["repository"]),
+            _encode_grouping_label("project", report["project"]),
+        )
+    )
+    request = urllib.request.Request(
+        f"{url.rstrip('/')}/metrics/job/{_PUSHGATEWAY_JOB}/{grouping_key}",
+        data=_format_prometheus_metrics(report).encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4"},
+        method="PUT",
+    )
+    with urllib.request.urlopen(request, timeout=_PUSHGATEWAY_TIMEOUT):
+        pass
+
+
+def write_report(succeeded: bool) -> None:
+    """Write the JSON report and push the metrics, if configured.
+
+    Failures are logged, but never fail the run.
+    """
+
+    if not is_enabled():
+        return
+
+    report = build_report(succeeded)
+
+    if report_path := config.config.metrics_report:
+        try:
+            pathlib.Path(report_path).write_text(
+                json.dumps(report, indent=2), encoding="utf-8"
+            )
+            log.info("Wrote metrics report to %s", report_path)
+        except OSError:
+            log.exception("Failed to write metrics report to %s", report_path)
+
+    if pushgateway_url := config.config.pushgateway_url:
+        try:
+            push_to_gateway(report, pushgateway_url)
+            log.info("Pushed metrics to %s", pushgateway_url)
+        # Malformed URLs raise a ValueError, invalid responses an
+        # HTTPException
+        except (OSError, ValueError, http.client.HTTPException):
+            log.exception("Failed to push metrics to %s", pushgateway_url)
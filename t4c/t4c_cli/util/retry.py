@@ -0,0 +1,74 @@
+# SPDX-FileCopyrightText: Copyright DB InfraGO AG and contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import collections.abc as cabc
+import logging
+import time
+import typing as t
+
+from . import config
+
+log = logging.getLogger(__name__)
+
+T = t.TypeVar("T")
+
+_MAX_BACKOFF_SECONDS = 600
+
+
+def call_with_retries(
+    func: cabc.Callable[[], T],
+    description: str,
+    retry_on: tuple[type[BaseException], ...],
+    before_retry: cabc.Callable[[], None] | None = None,
+) -> T:
+    """Call the function and retry it on transient errors.
+
+    The function is called up to `CDI_RETRY_ATTEMPTS` times. Only
+    exceptions in ``retry_on`` are retried, all other exceptions are
+    raised immediately. The delay between two attempts starts at
+    `CDI_RETRY_BACKOFF_SECONDS` and doubles after each attempt.
+
+    Parameters
+    ----------
+    func
+        Function to call.
+    description
+        Description of the operation for the logs.
+    retry_on
+        Exception types that are considered as transient.
+    before_retry
+        Function that is called before each retry, e.g., to clean up
+        the partial output of the failed attempt.
+    """
+
+    attempts = max(config.config.retry_attempts, 1)
+    for attempt in range(1, attempts + 1):
+        try:
+            return func()
+        except retry_on as e:
+            if attempt == attempts:
+                log.error(
+                    "%s failed after %d attempts: %s",
+                    description,
+                    attempts,
+                    e,
+                )
+                raise
+
+            delay = min(
+                config.config.retry_backoff_seconds * 2 ** (attempt - 1),
+                _MAX_BACKOFF_SECONDS,
+            )
+            log.warning(
+                "%s failed (attempt %d/%d): %s. Retrying in %.0f seconds...",
+                description,
+                attempt,
+                attempts,
+                e,
+                delay,
+            )
+            time.sleep(delay)
+            if before_retry:
+                before_retry()
+
+    raise AssertionError("unreachable")
@@ -0,0 +1,129 @@
+# SPDX-FileCopyrightText: Copyright DB InfraGO AG and contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import contextlib
+import dataclasses
+import errno
+import fcntl
+import logging
+import os
+import pathlib
+import shutil
+
+log = logging.getLogger(__name__)
+
+# Share the data blocks of two files (copy-on-write), see ioctl_ficlone(2)
+_FICLONE = 0x40049409
+
+# Errors which indicate that the filesystem doesn't support the operation
+_UNSUPPORTED_ERRORS = {
+    errno.EXDEV,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EINVAL,
+    errno.EPERM,
+    errno.EMLINK,
+}
+
+
+@dataclasses.dataclass
+class StagingStats:
+    reflinked: int = 0
+    hardlinked: int = 0
+    copied: int = 0
+
+
+class _FileStager:
+    """Stage single files with the cheapest method that works.
+
+    Reflinks are preferred, because the staged file is independent of
+    the source. If the filesystem doesn't support reflinks, hardlinks
+    are used, if allowed. Files are only copied if neither works, e.g.,
+    if source and target are on different filesystems. After the first
+    failure, a method is not tried again.
+    """
+
+    def __init__(self, allow_hardlinks: bool) -> None:
+        self.stats = StagingStats()
+        self._try_reflink = True
+        self._try_hardlink = allow_hardlinks
+
+    def _reflink(self, source: str, target: str) -> bool:
+        try:
+            with (
+                open(source, "rb") as source_file,
+                open(target, "wb") as target_file,
+            ):
+                fcntl.ioctl(
+                    target_file.fileno(), _FICLONE, source_file.fileno()
+                )
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_ERRORS:
+                raise
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(target)
+            self._try_reflink = False
+            return False
+
+        shutil.copystat(source, target)
+        return True
+
+    def _hardlink(self, source: str, target: str) -> bool:
+        try:
+            os.link(source, target)
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_ERRORS:
+                raise
+            self._try_hardlink = False
+            return False
+        return True
+
+    def __call__(self, source: str, target: str) -> str:
+        if self._try_reflink and self._reflink(source, target):
+            self.stats.reflinked += 1
+        elif self._try_hardlink and self._hardlink(source, target):
+            self.stats.hardlinked += 1
+        else:
+            shutil.copy2(source, target)
+            self.stats.copied += 1
+        return target
+
+
+def stage_directory(
+    source_dir: pathlib.Path,
+    target_dir: pathlib.Path,
+    allow_hardlinks: bool = False,
+) -> StagingStats:
+    """Recreate the source directory at the target without copying data.
+
+    An existing target directory is replaced. The files in the target
+    are reflinks of the source files, if the filesystem supports it.
+
+    Parameters
+    ----------
+    source_dir
+        The directory to stage.
+    target_dir
+        The directory to recreate the source directory in.
+    allow_hardlinks
+        Fall back to hardlinks if reflinks are not supported. Hardlinked
+        files share their content with the source, so only enable it if
+        the source is a disposable copy, which nobody else writes to.
+    """
+
+    if target_dir.exists():
+        shutil.rmtree(target_dir)
+    target_dir.parent.mkdir(parents=True, exist_ok=True)
+
+    stager = _FileStager(allow_hardlinks)
+    shutil.copytree(source_dir, target_dir, copy_function=stager)
+
+    log.debug(
+        "Staged %s in %s: %d reflinked, %d hardlinked, %d copied",
+        source_dir,
+        target_dir,
+        stager.stats.reflinked,
+        stager.stats.hardlinked,
+        stager.stats.copied,
+    )
+    return stager.stats
@@ -0,0 +1,96 @@
+# SPDX-FileCopyrightText: Copyright DB InfraGO AG and contributors
+# SPDX-License-Identifier: Apache-2.0
+
+import datetime
+import pathlib
+
+from t4c_cli.util import history
+
+FIRST_ACTIVITY = datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC)
+
+
+def _get_date(activity: int) -> datetime.datetime:
+    return FIRST_ACTIVITY + datetime.timedelta(hours=activity)
+
+
+def _create_index(cache_dir: pathlib.Path) -> history.ActivityIndex:
+    return history.ActivityIndex(
+        cache_dir,
+        host="localhost",
+        repository="repoCapella",
+        project="test",
+        git_repo_url="https://example.com/model.git",
+        git_branch="main",
+    )
+
+
+def _run_backup(
+    cache_dir: pathlib.Path,
+    last_backup: datetime.datetime | None,
+    activities: int,
+) -> tuple[datetime.datetime | None, list[str]]:
+    """Simulate a run, which fetches from T4C and updates the index."""
+    index = _create_index(cache_dir)
+    fetch_from = index.prepare_fetch(last_backup)
+    index.extend(
+        {
+            "description": f"Activity {activity}",
+            "date": _get_date(activity).isoformat(),
+            "user": "user",
+        }
+        for activity in range(activities)
+        if fetch_from is None or _get_date(activity) > fetch_from
+    )
+    index.save()
+    return fetch_from, [
+        activity["description"] for activity in index.activities
+    ]
+
+
+def test_fetch_starts_after_newest_indexed_activity(
+    tmp_path: pathlib.Path,
+) -> None:
+    _run_backup(tmp_path, None, activities=5)
+
+    fetch_from, pending = _run_backup(tmp_path, _get_date(2), activities=8)
+
+    assert fetch_from == _get_date(4)
+    assert pending == [f"Activity {activity}" for activity in range(3, 8)]
+
+
+def test_index_is_rebuilt_after_branch_reset(tmp_path: pathlib.Path) -> None:
+    _run_backup(tmp_path, None, activities=21)
+    _run_backup(tmp_path, _get_date(19), activities=21)
+
+    fetch_from, pending = _run_backup(tmp_path, None, activities=21)
+
+    assert fetch_from is None
+    assert pending == [f"Activity {activity}" for activity in range(21)]
+
+
+def test_index_is_rebuilt_if_last_backup_is_older(
+    tmp_path: pathlib.Path,
+) -> None:
+    _run_backup(tmp_path, _get_date(10), activities=21)
+
+    fetch_from, pending = _run_backup(tmp_path, _get_date(5), activities=21)
+
+    assert fetch_from == _get_date(5)
+    assert pending == [f"Activity {activity}" for activity in range(6, 21)]
+
+
+def test_indexes_of_git_branches_are_independent(
+    tmp_path: pathlib.Path,
+) -> None:
+    _run_backup(tmp_path, _get_date(10), activities=21)
+
+    other_index = history.ActivityIndex(
+        tmp_path,
+        host="localhost",
+        repository="repoCapella",
+        project="test",
+        git_repo_url="https://example.com/model.git",
+        git_branch="other",
+    )
+
+    assert other_index.prepare_fetch(None) is None